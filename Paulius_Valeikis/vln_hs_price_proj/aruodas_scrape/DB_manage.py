@@ -1,9 +1,153 @@
 # db_manager.py
+import asyncio
+import concurrent.futures
 import duckdb
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import pandas as pd
-from .html_parse import SCHEMA
+from .html_parse import SCHEMA, ParseDiagnostics
+
+#kiek eiluciu kaupiam atmintyje pries imetant i listings_stg
+FLUSH_ROWS = 500
+#kiek db darbu gali laukti rasytojo threado eileje, pilnai eilei korutina palaukia
+WRITE_QUEUE_SIZE = 1000
+#kiek darbu rasytojo threadas paima is eiles vienu kartu
+WRITE_BATCH = 200
+
+#listings lenteles tipai, visi kiti laukai lieka TEXT
+#listings_stg visada TEXT, konvertuojam tik finalize() metu
+LISTING_TYPES = {
+    "task_id": "BIGINT",
+    "ext_date": "DATE",
+    "price": "DOUBLE",
+    "price_per_month": "DOUBLE",
+    "rooms": "INTEGER",
+    "area_sqm": "DOUBLE",
+    "plot_area": "DOUBLE",
+    "floor": "INTEGER",
+    "floor_total": "INTEGER",
+    "year_of_creation": "INTEGER",
+    "peculiars": "TEXT[]",
+    "extra_spaces": "TEXT[]",
+    "extra_equipment": "TEXT[]",
+    "window_orientation": "TEXT[]",
+    "entry_date": "DATE",
+    "redacted_date": "DATE",
+    "active_till_date": "DATE",
+    "favorited": "INTEGER",
+    "views": "INTEGER",
+    "distance_to_water": "DOUBLE",
+}
+
+#kaip is teksto gauti tipa: "€ 125 000" -> 125000, "54,3 m²" -> 54.3, "1234/12" -> 1234
+#imamas pirmas skaicius (tukstanciai gali buti atskirti tarpais), kad "125 000 €2 300 €/m²" nesuliptu i viena
+CAST_SQL = {
+    "DOUBLE": r"TRY_CAST(replace(regexp_replace(regexp_extract({c}, '\d[\d \x{{00A0}}\x{{202F}}]*(?:[.,]\d+)?'), '[^0-9,.]', '', 'g'), ',', '.') AS DOUBLE)",
+    "INTEGER": r"TRY_CAST(regexp_extract({c}, '-?\d+') AS INTEGER)",
+    "BIGINT": "TRY_CAST({c} AS BIGINT)",
+    "DATE": "TRY_CAST({c} AS DATE)",
+    "TEXT[]": "string_split(NULLIF({c}, ''), ';')",
+}
+#metuose gali buti "1975 m. statyba, 2018 m. renovacija", imam pirmus
+CAST_SQL_FIELD = {
+    "year_of_creation": r"TRY_CAST(regexp_extract({c}, '\d{{4}}') AS INTEGER)",
+}
+
+
+#listings stulpeliai kurie ne is parserio, o skaiciuojami is tipizuotu lauku finalize() metu
+#listing_code - skelbimo kodas be dienos, atskiras stulpelis kad jungimams nereiktu split_part kiekvienai eilutei
+DERIVED_SQL = {
+    "price_per_sqm": "round({price} / NULLIF({area_sqm}, 0), 2)",
+    "listing_code": "split_part({listing_id}, '_', 1)",
+}
+DERIVED_TYPES = {
+    "price_per_sqm": "DOUBLE",
+    "listing_code": "TEXT",
+}
+#listings = SCHEMA + isvestiniai stulpeliai gale
+LISTING_COLUMNS = SCHEMA + list(DERIVED_SQL)
+#tipizuoti laukai kuriu nepavykusi konversija skaitoma kaip formato klaida
+CHECKED_FIELDS = [f for f in SCHEMA if LISTING_TYPES.get(f, "TEXT") not in ("TEXT", "TEXT[]") and f not in ("task_id", "ext_date")]
+
+#CDC: kasdien besikeiciantys laukai eina i listing_seen, kainos i price_history,
+#visi kiti i attr_history (laukas, reiksme) tik kai pasikeicia
+SEEN_FIELDS = ["task_id", "category", "ext_date", "favorited", "views"]
+PRICE_FIELDS = ["price", "price_per_month"]
+ATTR_FIELDS = [f for f in SCHEMA if f not in ["listing_id"] + SEEN_FIELDS + PRICE_FIELDS]
+
+#rinkos agregatai: metrikos ir ju israiskos is listings stulpeliu
+MARKET_METRICS = {
+    "price": "price",
+    "price_sqm": "price / NULLIF(area_sqm, 0)",
+    "area_sqm": "area_sqm",
+}
+#kvantiliu sketch'as: reiksme x patenka i bucket ceil(log_gamma(x)), santykine paklaida SKETCH_ACCURACY
+#bucket'u skaiciai tiesiog sumuojami, tai dienas/rajonus galima apjungti be pilno skenavimo
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+#artimi dublikatai (tas pats objektas su kitu kodu ar kito agento): MinHash parasas is normalizuotu
+#atributu aibes, LSH juostos (listing_lsh) - palyginami tik skelbimai su bent viena bendra juosta
+#tokenai is listings stulpeliu, NULL tokenai praleidziami. Kategorija, miestas ir gatve - ne tokenai, o juostos
+#rakto dalis (DEDUP_BLOCK): skirtingose gatvese skelbimai niekada nelyginami, kad ir kokie panasus
+DEDUP_BLOCK = ("category || '|' || coalesce(lower(strip_accents(city)), '') || '|' || "
+    r"regexp_replace(lower(strip_accents(trim(street))), '\s+(g|pr|al|pl|skg|kel)\.?$', '')")
+DEDUP_TOKENS = {
+    "hood": "lower(strip_accents(hood))",
+    "no": "lower(replace(house_number, ' ', ''))",
+    "rooms": "rooms",
+    "area": "round(area_sqm)",
+    "area5": "round(area_sqm / 5)",
+    "floor": "floor",
+    "floors": "floor_total",
+    "price": "CASE WHEN coalesce(price, price_per_month) > 0 THEN floor(ln(coalesce(price, price_per_month)) / ln(1.05)) END",
+}
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+#nuo tokio sutampanciu parasu daliu (Jaccard ivertis) laikom tuo paciu objektu
+DUPLICATE_SIMILARITY = 0.6
+
+#frontier busenos: indekso puslapiai "done"/"last"/"stopped", skelbimai "pending" -> "done"/"failed" arba "carry"
+FRONTIER_COLUMNS = ["task_id", "url", "kind", "listing_code", "card_hash", "status", "updated"]
+ARCHIVE_PAGE_COLUMNS = ["url", "listing_code", "fetch_date", "category", "kind", "task_id", "sha256"]
+#darbu eile (work_queue): indekso puslapiai "pending" -> "leased" -> "done"/"last" (302) arba "failed",
+#kai task'o puslapiai baigti - vienas "finish" darbas (page 0) finalize ir kt. zingsniams
+#tiek kartu isnuomotas ir nebaigtas darbas laikomas nepavykusiu
+MAX_LEASE_ATTEMPTS = 3
+
+
+#listings eilute vienai dienai vienam skelbimui: pakartotinai imetus perrasoma, ne dubliuojama
+LISTING_KEY_INDEX = "listings_listing_id"
+#skelbimo visu dienu eilutes pagal koda
+LISTING_CODE_INDEX = "listings_listing_code"
+
+
+#ON CONFLICT (listing_id) - visi kiti stulpeliai is naujos eilutes
+def listing_upsert_sql():
+    updates = ",\n".join(f"{f} = excluded.{f}" for f in LISTING_COLUMNS if f != "listing_id")
+    return f"ON CONFLICT (listing_id) DO UPDATE SET\n{updates}"
+
+
+#TEXT lauko konversija i listings tipa
+def cast_sql(field):
+    field_type = LISTING_TYPES.get(field, "TEXT")
+    template = CAST_SQL_FIELD.get(field, CAST_SQL.get(field_type, "{c}"))
+    return template.format(c=field)
+
+
+#SELECT kuris TEXT stulpelius pavercia listings tipais, konversija vyksta visai lentelei is karto
+#isvestiniai stulpeliai skaiciuojami is tu paciu israisku, be papildomo perejimo
+def typed_select_sql(source):
+    casts = {field: cast_sql(field) for field in SCHEMA}
+    exprs = [f"{casts[field]} AS {field}" for field in SCHEMA]
+    exprs += [f"{template.format(**casts)} AS {field}" for field, template in DERIVED_SQL.items()]
+    return "SELECT " + ",\n".join(exprs) + f" FROM {source}"
 
 
 class DBManager:
@@ -17,6 +161,15 @@ class DBManager:
     def ensure_schema(self):
        self.create_tasks_table()
        self.create_table_from_schema()
+       self.create_url_index_table()
+       self.create_archive_tables()
+       self.create_frontier_table()
+       self.create_cdc_tables()
+       self.create_market_tables()
+       self.create_parse_stats_table()
+       self.create_task_metrics_table()
+       self.create_work_queue_table()
+       self.create_dedup_tables()
 
     #dinamiskai sugeneruoja lenteliu sql
     def create_sql_from_schema(self):
@@ -35,12 +188,14 @@ class DBManager:
         with open("aruodas_scrape/SQL/create_listing_table.sql", "w") as f:
             sql = """CREATE TABLE IF NOT EXISTS listings (
             """
-            sql = sql + f"\n{SCHEMA[0]} TEXT"
-            for field in SCHEMA[1:]:
+            sql = sql + f"\n{SCHEMA[0]} {LISTING_TYPES.get(SCHEMA[0], 'TEXT')}"
+            for field in LISTING_COLUMNS[1:]:
                 sql = sql + ",\n"
-                sql = sql + f"{field} TEXT"
+                sql = sql + f"{field} {DERIVED_TYPES.get(field) or LISTING_TYPES.get(field, 'TEXT')}"
                 
 
+            #artimu dublikatu grupe, pildo update_clusters
+            sql = sql + ",\ncluster_id TEXT"
             sql = sql + ");"  
 
             f.write(sql) 
@@ -51,11 +206,143 @@ class DBManager:
         with open("aruodas_scrape/SQL/create_listing_stg_table.sql", "r") as f:
             sql = f.read()
             self.con.execute(sql)
+        self.migrate_text_listings()
         with open("aruodas_scrape/SQL/create_listing_table.sql", "r") as f:
             sql = f.read()
             self.con.execute(sql)
+        self.add_derived_columns()
+        self.con.execute("ALTER TABLE listings ADD COLUMN IF NOT EXISTS cluster_id TEXT;")
+        self.create_listing_key()
+        self.create_listing_code_index()
+
+    #unikalus indeksas listing_id, senose db pries tai pasalinami tos pacios dienos dublikatai
+    #(paliekama is naujausio task'o)
+    def create_listing_key(self):
+        exists = self.con.execute("""
+            SELECT count(*) FROM duckdb_indexes() WHERE index_name = ?;
+        """, [LISTING_KEY_INDEX]).fetchone()[0]
+        if exists:
+            return
+        self.con.execute("""
+            DELETE FROM listings
+            WHERE rowid IN (
+                SELECT rowid
+                FROM listings
+                WHERE listing_id IS NOT NULL
+                QUALIFY row_number() OVER (PARTITION BY listing_id ORDER BY task_id DESC, rowid DESC) > 1
+            );
+        """)
+        self.con.execute(f"CREATE UNIQUE INDEX {LISTING_KEY_INDEX} ON listings (listing_id);")
+
+    def create_listing_code_index(self):
+        self.con.execute(f"CREATE INDEX IF NOT EXISTS {LISTING_CODE_INDEX} ON listings (listing_code);")
+
+    #senose db listings nera isvestiniu stulpeliu: pridedam ir uzpildom viena UPDATE
+    def add_derived_columns(self):
+        existing = {name for name, in self.con.execute("""
+            SELECT column_name FROM information_schema.columns WHERE table_name = 'listings';
+        """).fetchall()}
+        missing = [field for field in DERIVED_SQL if field not in existing]
+        for field in missing:
+            self.con.execute(f"ALTER TABLE listings ADD COLUMN {field} {DERIVED_TYPES[field]};")
+        if len(missing) > 0:
+            columns = {field: field for field in SCHEMA}
+            updates = ", ".join(f"{field} = {DERIVED_SQL[field].format(**columns)}" for field in missing)
+            self.con.execute(f"UPDATE listings SET {updates};")
+
+    #senose db listings buvo vien TEXT, perkeliam i tipizuota lentele
+    def migrate_text_listings(self):
+        price_type = self.con.execute("""
+            SELECT data_type
+            FROM information_schema.columns
+            WHERE table_name = 'listings' AND column_name = 'price';
+        """).fetchone()
+        if price_type is None or price_type[0] != "VARCHAR":
+            return
+
+        self.con.execute("ALTER TABLE listings RENAME TO listings_text;")
+        with open("aruodas_scrape/SQL/create_listing_table.sql", "r") as f:
+            self.con.execute(f.read())
+        self.con.execute(f"INSERT INTO listings BY NAME {typed_select_sql('listings_text')};")
+        self.con.execute("DROP TABLE listings_text;")
         
 
+    def create_url_index_table(self):
+        with open("aruodas_scrape/SQL/create_url_index_table.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+        #senose db buvo niekur neskaitomi content_hash ir redacted_date
+        self.con.execute("ALTER TABLE url_index DROP COLUMN IF EXISTS content_hash;")
+        self.con.execute("ALTER TABLE url_index DROP COLUMN IF EXISTS redacted_date;")
+
+    def create_archive_tables(self):
+        with open("aruodas_scrape/SQL/create_archive_tables.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
+    #listings_current ir listing_snapshots priklauso nuo SCHEMA, tai generuojam kaip ir listings
+    def create_cdc_sql_from_schema(self):
+        with open("aruodas_scrape/SQL/create_listing_current_table.sql", "w") as f:
+            sql = """CREATE TABLE IF NOT EXISTS listings_current (
+            """
+            sql = sql + "\nlisting_code TEXT"
+            for field in SCHEMA:
+                sql = sql + ",\n"
+                sql = sql + f"{field} {LISTING_TYPES.get(field, 'TEXT')}"
+            sql = sql + ",\nfirst_seen DATE,\nlast_seen DATE,\nPRIMARY KEY (listing_code));"
+            f.write(sql)
+
+        with open("aruodas_scrape/SQL/create_listing_snapshots_view.sql", "w") as f:
+            f.write(snapshots_view_sql())
+
+    def create_cdc_tables(self):
+        self.create_cdc_sql_from_schema()
+        for name in ["create_cdc_tables.sql", "create_listing_current_table.sql", "create_listing_snapshots_view.sql"]:
+            with open(f"aruodas_scrape/SQL/{name}", "r") as f:
+                sql = f.read()
+                self.con.execute(sql)
+
+    #senose db agregatai be city (keli miestai susilieja), ju neisskaidysi - perskaiciuojam is naujo
+    def create_market_tables(self):
+        old = self.con.execute("""
+            SELECT count(*) FROM information_schema.tables
+            WHERE table_name = 'market_daily'
+                AND 'city' NOT IN (SELECT column_name FROM information_schema.columns WHERE table_name = 'market_daily');
+        """).fetchone()[0]
+        if old:
+            self.con.execute("DROP TABLE market_daily;")
+            self.con.execute("DROP TABLE IF EXISTS market_sketch;")
+        with open("aruodas_scrape/SQL/create_market_tables.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+        if old:
+            self.rebuild_market_stats()
+
+    def create_parse_stats_table(self):
+        with open("aruodas_scrape/SQL/create_parse_stats_table.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
+    def create_task_metrics_table(self):
+        with open("aruodas_scrape/SQL/create_task_metrics_table.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
+    def create_dedup_tables(self):
+        with open("aruodas_scrape/SQL/create_dedup_tables.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
+    def create_work_queue_table(self):
+        with open("aruodas_scrape/SQL/create_work_queue_table.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
+    def create_frontier_table(self):
+        with open("aruodas_scrape/SQL/create_frontier_table.sql", "r") as f:
+            sql = f.read()
+            self.con.execute(sql)
+
     def create_tasks_table(self):
         with open("aruodas_scrape/SQL/create_task_seq.sql", "r") as f:
             sql = f.read()
@@ -63,15 +350,17 @@ class DBManager:
         with open("aruodas_scrape/SQL/create_task_table.sql", "r") as f:
             sql = f.read()
             self.con.execute(sql)
+        #senose db nera miesto
+        self.con.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS city TEXT;")
         
-    #funkcija loginimui
-    def start_task(self, category=None, pages=None):
+    #funkcija loginimui, grazina task_id kad galima butu vykdyti kelis taskus vienu metu
+    def start_task(self, category=None, pages=None, city=None):
         start_time = datetime.now(timezone.utc)
 
         self.con.execute("""
-            INSERT INTO tasks (run_date, category, start_time, status, pages)
-            VALUES (?, ?, ?, 'running', ?);
-        """, [self.run_date, category, start_time, pages])
+            INSERT INTO tasks (run_date, category, city, start_time, status, pages)
+            VALUES (?, ?, ?, ?, 'running', ?);
+        """, [self.run_date, category, city, start_time, pages])
 
         # paimam paskutinį įrašytą task_id
         self.task_id = self.con.execute("""
@@ -80,22 +369,237 @@ class DBManager:
             ORDER BY task_id DESC
             LIMIT 1;
         """).fetchone()[0]
+        return self.task_id
     #funkcija loginimui pabaigt
-    def finish_task(self, records=0, error=None):
+    def finish_task(self, records=0, error=None, task_id=None, pages=None):
        
         end_time = datetime.now(timezone.utc)
         status = "failed" if error else "success"
 
         self.con.execute("""
             UPDATE tasks
-            SET end_time = ?, status = ?, records = ?, error = ?
+            SET end_time = ?, status = ?, records = ?, error = ?, pages = coalesce(?, pages)
             WHERE task_id = ?;
-        """, [end_time, status, records, error, self.task_id])
+        """, [end_time, status, records, error, pages, task_id or self.task_id])
     # apvalom nuo seno run
     #tuo paciu metu galima zvilgtelt i stg lentelel jei paskutinis runas buvo blogas
+    #nebaigti taskai po sito nebegali buti pratesti, tai juos pazymim
     def begin_run(self):
         self.con.execute("""TRUNCATE TABLE listings_stg;
         """)
+        self.con.execute("""
+            UPDATE tasks SET status = 'abandoned' WHERE status = 'running';
+        """)
+
+    #naujas run'as: po task'a kiekvienai kategorijai, grazina [(task_id, category, run_date)]
+    def start_run(self, categories):
+        self.begin_run()
+        return [(self.start_task(category=key), key, self.run_date) for key in categories]
+
+    #naujas run'as is konfiguracijos: task'as kiekvienam (miestas, kategorija), eileje ju pirmi puslapiai
+    #targets - [(city, category, url)], grazina [(task_id, category, run_date)]
+    def enqueue_run(self, targets):
+        self.begin_run()
+        now = utcnow()
+        self.con.execute("""
+            UPDATE work_queue SET status = 'abandoned', updated = ? WHERE status IN ('pending', 'leased');
+        """, [now])
+        tasks = []
+        for city, key, url in targets:
+            task_id = self.start_task(category=key, city=city)
+            self.con.execute("""
+                INSERT INTO work_queue (task_id, page, kind, city, category, url, status, attempts, updated)
+                VALUES (?, 1, 'index', ?, ?, ?, 'pending', 0, ?);
+            """, [task_id, city, key, f"{url}/", now])
+            tasks.append((task_id, key, self.run_date))
+        return tasks
+
+    #taskai kuriu darbai eileje dar nebaigti (task_id, category, run_date), pratesimui ir darbininku pabaigai
+    def open_work_tasks(self):
+        return self.con.execute("""
+            SELECT DISTINCT t.task_id, t.category, t.run_date
+            FROM work_queue q
+            JOIN tasks t ON t.task_id = q.task_id
+            WHERE q.status IN ('pending', 'leased') AND t.status = 'running'
+            ORDER BY t.task_id;
+        """).fetchall()
+
+    #isnuomoja iki limit darbu: laukiancius ir tuos kuriu nuoma baigesi (darbininkas nuluzo ar uzstrigo)
+    #uzbaigimo darbai (page 0) pirmi, toliau mazesni puslapiai - visi taskai juda kartu
+    #grazina [(task_id, page, kind, category, url)]
+    def lease_work(self, worker, lease_seconds, limit=1, max_attempts=MAX_LEASE_ATTEMPTS):
+        now = utcnow()
+        exhausted = self.con.execute("""
+            UPDATE work_queue
+            SET status = 'failed', error = coalesce(error, 'lease expired'), lease_until = NULL, updated = ?
+            WHERE status = 'leased' AND lease_until < ? AND attempts >= ?
+            RETURNING task_id;
+        """, [now, now, max_attempts]).fetchall()
+        for task_id in sorted({task_id for task_id, in exhausted}):
+            self.queue_finish_if_done(task_id)
+
+        return self.con.execute("""
+            UPDATE work_queue q
+            SET status = 'leased', worker = $worker, lease_until = $lease_until, attempts = q.attempts + 1, updated = $now
+            FROM (
+                SELECT task_id, page
+                FROM work_queue
+                WHERE status = 'pending' OR (status = 'leased' AND lease_until < $now)
+                ORDER BY page, task_id
+                LIMIT $limit
+            ) l
+            WHERE q.task_id = l.task_id AND q.page = l.page
+            RETURNING q.task_id, q.page, q.kind, q.category, q.url;
+        """, {"worker": worker, "lease_until": now + timedelta(seconds=lease_seconds), "now": now, "limit": limit}).fetchall()
+
+    #gyvas darbininkas pratesia savo nuomas, nuluzusio nuomos baigiasi ir darbai grizta i eile
+    def renew_leases(self, worker, lease_seconds):
+        self.con.execute("""
+            UPDATE work_queue SET lease_until = ?
+            WHERE worker = ? AND status = 'leased';
+        """, [utcnow() + timedelta(seconds=lease_seconds), worker])
+
+    #BEGIN/COMMIT, o klaidos atveju ROLLBACK ir klaida toliau
+    #be ROLLBACK bendras rasytojo rysys liktu "transaction is aborted" busenoj ir kiti darbai griutu
+    @contextmanager
+    def transaction(self):
+        self.con.execute("BEGIN TRANSACTION;")
+        try:
+            yield
+        except Exception:
+            self.con.execute("ROLLBACK;")
+            raise
+        self.con.execute("COMMIT;")
+
+    #kitas indekso puslapis i eile kai tik sito korteles frontier, nelaukiant jo skelbimu
+    #sitas puslapis lieka isnuomotas kol skelbimai parsiusti, nuluzus ji perims kitas (INSERT OR IGNORE)
+    def queue_next_page(self, task_id, page, worker, next_url):
+        self.con.execute("""
+            INSERT OR IGNORE INTO work_queue (task_id, page, kind, city, category, url, status, attempts, updated)
+            SELECT task_id, page + 1, kind, city, category, ?, 'pending', 0, ?
+            FROM work_queue
+            WHERE task_id = ? AND page = ? AND worker = ? AND status = 'leased';
+        """, [next_url, utcnow(), task_id, page, worker])
+
+    #darbininkas baige darba: status "done" arba "last" (302)
+    #False jei nuoma jau perimta kito darbininko (tada jo rezultatas galioja)
+    def complete_work(self, task_id, page, worker, status="done"):
+        with self.transaction():
+            done = self.con.execute("""
+                UPDATE work_queue SET status = ?, lease_until = NULL, updated = ?
+                WHERE task_id = ? AND page = ? AND worker = ? AND status = 'leased'
+                RETURNING page;
+            """, [status, utcnow(), task_id, page, worker]).fetchall()
+            if done:
+                self.queue_finish_if_done(task_id)
+        return len(done) > 0
+
+    #nepavykes bandymas: atgal i eile, arba "failed" jei bandymu nebeliko
+    def release_work(self, task_id, page, worker, error, max_attempts=MAX_LEASE_ATTEMPTS):
+        with self.transaction():
+            released = self.con.execute("""
+                UPDATE work_queue
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    error = ?, lease_until = NULL, updated = ?
+                WHERE task_id = ? AND page = ? AND worker = ? AND status = 'leased'
+                RETURNING status;
+            """, [max_attempts, error, utcnow(), task_id, page, worker]).fetchall()
+            if released and released[0][0] == "failed":
+                self.queue_finish_if_done(task_id)
+
+    #visi task'o puslapiai baigti ir paskutinis zinomas (302 arba nepavykes) -> uzbaigimo darbas i eile
+    def queue_finish_if_done(self, task_id):
+        open_pages, ended = self.con.execute("""
+            SELECT count(*) FILTER (status IN ('pending', 'leased')), count(*) FILTER (status IN ('last', 'failed')) > 0
+            FROM work_queue
+            WHERE task_id = ? AND kind = 'index';
+        """, [task_id]).fetchone()
+        if open_pages == 0 and ended:
+            self.con.execute("""
+                INSERT OR IGNORE INTO work_queue (task_id, page, kind, city, category, url, status, attempts, updated)
+                SELECT task_id, 0, 'finish', city, category, NULL, 'pending', 0, ?
+                FROM work_queue
+                WHERE task_id = ? AND page = 1;
+            """, [utcnow(), task_id])
+
+    #nepavyke task'o indekso puslapiai, uzbaigimo metu irasomi kaip task'o klaida
+    def failed_pages(self, task_id):
+        return [page for page, in self.con.execute("""
+            SELECT page FROM work_queue WHERE task_id = ? AND kind = 'index' AND status = 'failed' ORDER BY page;
+        """, [task_id]).fetchall()]
+
+    #paskutinio nutraukto run'o taskai (task_id, category, run_date) pratesimui
+    #darbu eiles taskus pratesia pati eile (open_work_tasks)
+    def unfinished_tasks(self):
+        return self.con.execute("""
+            SELECT task_id, category, run_date
+            FROM tasks
+            WHERE status = 'running'
+                AND run_date = (SELECT max(run_date) FROM tasks WHERE status = 'running')
+                AND task_id NOT IN (SELECT task_id FROM work_queue)
+            ORDER BY task_id;
+        """).fetchall()
+
+    #kiek eiluciu taskas jau turi listings_stg, ir is ankstesniu bandymu
+    def stg_records(self, task_id=None):
+        return self.con.execute("""
+            SELECT count(*) FROM listings_stg WHERE task_id = CAST(? AS TEXT);
+        """, [task_id or self.task_id]).fetchone()[0]
+
+    #indekso puslapis ir jo skelbimai i frontier vienoje transakcijoje
+    #fetch_urls bus parsiusti, kiti korteles skelbimai tik perkeliami (carry)
+    def add_frontier(self, task_id, page_url, cards, fetch_urls):
+        now = utcnow()
+        fetch_urls = set(fetch_urls)
+        rows = [(task_id, url, "listing", code, card_hash, "pending" if url in fetch_urls else "carry", now)
+                for code, url, card_hash in cards]
+        rows.append((task_id, page_url, "index", None, None, "done", now))
+        self.con.register("frontier_new", pd.DataFrame(rows, columns=FRONTIER_COLUMNS))
+
+        self.con.execute("BEGIN TRANSACTION;")
+        self.con.execute("INSERT OR IGNORE INTO frontier BY NAME SELECT * FROM frontier_new;")
+        self.con.execute("COMMIT;")
+        self.con.unregister("frontier_new")
+
+    #paskutinis (redirectinamas) indekso puslapis, discovery baigtas
+    #status 'stopped' - sustota anksciau, nes puslapiuose tik zinomi skelbimai
+    def end_frontier(self, task_id, page_url, status="last"):
+        self.con.execute("""
+            INSERT OR IGNORE INTO frontier (task_id, url, kind, status, updated)
+            VALUES (?, ?, 'index', ?, ?);
+        """, [task_id, page_url, status, utcnow()])
+
+    #pazymi apdorotus skelbimus, kviesti toje pacioje transakcijoje kaip ir ju eiluciu insert
+    def checkpoint(self, task_id, url_status):
+        self.con.register("frontier_done", pd.DataFrame(url_status, columns=["url", "status"]))
+        self.con.execute("""
+            UPDATE frontier f
+            SET status = d.status, updated = ?
+            FROM frontier_done d
+            WHERE f.task_id = ? AND f.url = d.url;
+        """, [utcnow(), task_id])
+        self.con.unregister("frontier_done")
+
+    #nutraukto task'o busena: (cards, carry_codes, todo_urls, pages, discovered)
+    def load_frontier(self, task_id):
+        cards = self.con.execute("""
+            SELECT listing_code, url, card_hash
+            FROM frontier
+            WHERE task_id = ? AND kind = 'listing'
+            ORDER BY updated, url;
+        """, [task_id]).fetchall()
+        carry_codes = [code for code, in self.con.execute("""
+            SELECT listing_code FROM frontier WHERE task_id = ? AND status = 'carry';
+        """, [task_id]).fetchall()]
+        todo_urls = [url for url, in self.con.execute("""
+            SELECT url FROM frontier WHERE task_id = ? AND status = 'pending' ORDER BY updated, url;
+        """, [task_id]).fetchall()]
+        pages, discovered = self.con.execute("""
+            SELECT count(*) FILTER (status = 'done'), count(*) FILTER (status IN ('last', 'stopped')) > 0
+            FROM frontier
+            WHERE task_id = ? AND kind = 'index';
+        """, [task_id]).fetchone()
+        return cards, carry_codes, todo_urls, pages, discovered
     #funkcija imetimui eiluciu pagal zodyna
     def insert_row(self, row_dict: dict, category):
 
@@ -113,9 +617,504 @@ class DBManager:
         self.con.execute("INSERT INTO listings_stg SELECT * FROM tmp;")
         self.con.unregister("tmp")
 
+    #buferizuotas rasytojas vienai kategorijai, naudoti vietoj insert_row
+    #atskiras threadas db darbams, kuriuo naudojasi event loop (pipeline)
+    def async_writer(self, queue_size=WRITE_QUEUE_SIZE, batch=WRITE_BATCH):
+        return AsyncWriter(self, queue_size, batch)
+
+    def writer(self, category, flush_rows=FLUSH_ROWS, task_id=None):
+        return BatchWriter(self, category, flush_rows, task_id or self.task_id)
+
+    #imeta visa stulpelini buferi vienu INSERT
+    def insert_batch(self, columns: dict):
+        df = pd.DataFrame(columns, columns=SCHEMA)
+        self.con.register("stg_batch", df)
+
+        self.con.execute("INSERT INTO listings_stg BY NAME SELECT * FROM stg_batch;")
+        self.con.unregister("stg_batch")
+
+    #eilutes, ju frontier busenos ir ju parse_stats kartu, kad nutrukus procesui jos nesiskirtu
+    #pratestas task'as tada tes ir parse_stats sumas nuo ten kur sustojo
+    def insert_checkpoint(self, columns: dict, task_id, url_status, stats=()):
+        with self.transaction():
+            if len(columns[SCHEMA[0]]) > 0:
+                self.insert_batch(columns)
+            if len(url_status) > 0:
+                self.checkpoint(task_id, url_status)
+            self.save_parse_stats(stats, task_id)
+
+    #perraso listings eilutes is naujo istrauktais duomenimis (reparse), listing_id lieka tas pats
+    #upsert kaip finalize, cluster_id lieka
+    def replace_listings(self, columns: dict):
+        df = pd.DataFrame(columns, columns=SCHEMA).astype("string")
+        self.con.register("replace_batch", df)
+
+        try:
+            with self.transaction():
+                self.con.execute(f"INSERT INTO listings BY NAME {typed_select_sql('replace_batch')} {listing_upsert_sql()};")
+        finally:
+            self.con.unregister("replace_batch")
+
     #jei parejo be klaidu imetam viska i galutine laikymo lentele
-    def finalize(self):
-        self.con.execute("INSERT INTO listings SELECT * FROM listings_stg;")
+    #tipu konversija ir isvestiniai stulpeliai visam task'ui vienu INSERT, nepavykusios konversijos i parse_stats
+    #upsert pagal listing_id: pakartotas ar pratestas run'as ta pacia diena perraso, o ne dubliuoja
+    #stg dublikatai pirma atmetami (paliekama veliausiai imesta eilute)
+    def finalize(self, task_id=None):
+        task_id = task_id or self.task_id
+        self.con.execute(f"""
+            INSERT INTO listings BY NAME {typed_select_sql('listings_stg')}
+            WHERE task_id = CAST(? AS TEXT) AND listing_id IS NOT NULL
+            QUALIFY row_number() OVER (PARTITION BY listing_id ORDER BY rowid DESC) = 1
+            {listing_upsert_sql()};
+        """, [task_id])
+        return self.record_cast_failures(task_id)
+
+    #kiek ne tusciu reiksmiu nepavyko paversti skaiciumi/data, pagal lauka
+    #grazina {field: (kiekis, pavyzdys)}, vienas perejimas per task'o listings_stg
+    def record_cast_failures(self, task_id=None):
+        task_id = task_id or self.task_id
+        exprs = ", ".join(
+            f"count(*) FILTER (WHERE NULLIF(trim({f}), '') IS NOT NULL AND {cast_sql(f)} IS NULL), "
+            f"min({f}) FILTER (WHERE NULLIF(trim({f}), '') IS NOT NULL AND {cast_sql(f)} IS NULL)"
+            for f in CHECKED_FIELDS
+        )
+        row = self.con.execute(f"""
+            SELECT {exprs} FROM listings_stg WHERE task_id = CAST(? AS TEXT);
+        """, [task_id]).fetchone()
+        failures = {
+            field: (row[2 * i], row[2 * i + 1]) for i, field in enumerate(CHECKED_FIELDS) if row[2 * i] > 0
+        }
+        self.save_parse_stats([("cast_failure", field, n) for field, (n, _) in failures.items()], task_id)
+        return failures
+
+    #incrementiniam rezimui: nusprendzia kuriuos skelbimus reikia parsisiusti is naujo
+    #cards - (listing_code, url, card_hash) is indekso puslapiu
+    #grazina (fetch_urls, carry_codes)
+    def plan_fetch(self, cards, refresh_days):
+        cutoff = utcnow() - timedelta(days=refresh_days)
+        self.con.register("cards", pd.DataFrame(cards, columns=["listing_code", "url", "card_hash"]))
+
+        plan = self.con.execute("""
+            SELECT c.listing_code, c.url,
+                u.listing_code IS NULL
+                OR u.last_listing_id IS NULL
+                OR u.card_hash IS DISTINCT FROM c.card_hash
+                OR u.last_fetch < ? AS need_fetch
+            FROM cards c
+            LEFT JOIN url_index u USING (listing_code);
+        """, [cutoff]).fetchall()
+        self.con.unregister("cards")
+
+        fetch_urls = [url for _, url, need_fetch in plan if need_fetch]
+        carry_codes = [code for code, _, need_fetch in plan if not need_fetch]
+        return fetch_urls, carry_codes
+
+    #kiek korteliu skelbimu dar nera url_index (visai nauji)
+    def count_new(self, cards):
+        self.con.register("cards", pd.DataFrame(cards, columns=["listing_code", "url", "card_hash"]))
+        new = self.con.execute("""
+            SELECT count(*) FROM cards WHERE listing_code NOT IN (SELECT listing_code FROM url_index);
+        """).fetchone()[0]
+        self.con.unregister("cards")
+        return new
+
+    #paskutinio pilno perejimo (iki 302) data kategorijai, None jei dar nebuvo
+    def last_full_sweep(self, category):
+        return self.con.execute("""
+            SELECT max(t.run_date)
+            FROM tasks t
+            JOIN frontier f ON f.task_id = t.task_id AND f.kind = 'index' AND f.status = 'last'
+            WHERE t.category = ? AND t.status = 'success';
+        """, [category]).fetchone()[0]
+
+    #anksti sustojus: skelbimai neaplankytuose puslapiuose laikomi dar esanciais,
+    #jei buvo matyti nuo paskutinio pilno perejimo. Dingusius pagauna kitas pilnas perejimas
+    def unvisited_codes(self, task_id, category):
+        return [code for code, in self.con.execute("""
+            SELECT u.listing_code
+            FROM url_index u
+            WHERE u.category = ?
+                AND u.last_seen >= (
+                    SELECT max(t.run_date)
+                    FROM tasks t
+                    JOIN frontier f ON f.task_id = t.task_id AND f.kind = 'index' AND f.status = 'last'
+                    WHERE t.category = ? AND t.status = 'success'
+                )
+                AND u.listing_code NOT IN (
+                    SELECT listing_code FROM frontier WHERE task_id = ? AND kind = 'listing'
+                )
+                AND EXISTS (SELECT 1 FROM frontier WHERE task_id = ? AND status = 'stopped');
+        """, [category, category, task_id, task_id]).fetchall()]
+
+    #nepasikeitusiems skelbimams nukopijuojam paskutini snapshot su siandienos data
+    #url_index pastumiam tik tiems, kuriu eilute tikrai irasyta (be snapshot'o kodas lieka kaip buvo)
+    def carry_forward(self, codes, task_id=None):
+        if len(codes) == 0:
+            return 0
+        self.con.register("carry", pd.DataFrame({"listing_code": codes}))
+
+        with self.transaction():
+            carried = self.con.execute(f"""
+                INSERT INTO listings
+                SELECT l.* REPLACE (
+                    u.listing_code || '_' || strftime(?, '%Y-%m-%d') AS listing_id,
+                    ? AS task_id,
+                    ? AS ext_date
+                )
+                FROM (SELECT DISTINCT listing_code FROM carry) c
+                JOIN url_index u USING (listing_code)
+                JOIN listings l ON l.listing_id = u.last_listing_id
+                {listing_upsert_sql()}
+                RETURNING listing_code, listing_id;
+            """, [self.run_date, task_id or self.task_id, self.run_date]).fetchall()
+            self.con.register("carried", pd.DataFrame(carried, columns=["listing_code", "listing_id"], dtype=object))
+
+            self.con.execute("""
+                UPDATE url_index
+                SET last_listing_id = c.listing_id, last_seen = ?
+                FROM carried c
+                WHERE url_index.listing_code = c.listing_code;
+            """, [self.run_date])
+        self.con.unregister("carried")
+        self.con.unregister("carry")
+        return len(carried)
+
+    #task'o skelbimu MinHash parasai i listing_signatures/listing_lsh, ir cluster_id i listings
+    #naujas ar pasikeites skelbimas gauna maziausia panasiu skelbimu cluster_id (arba savo koda)
+    #task_id None - visi skelbimai (pirmas indekso uzpildymas senai db)
+    def update_clusters(self, task_id=None):
+        where, listings_where = ("task_id = ?", "l.task_id = ?") if task_id is not None else ("true", "true")
+        params = [task_id] if task_id is not None else []
+        tokens = ", ".join(f"'{name}:' || CAST({expr} AS TEXT)" for name, expr in DEDUP_TOKENS.items())
+        bands = ", ".join(
+            f"({b}, hash(block, signature[{b * LSH_ROWS + 1}:{(b + 1) * LSH_ROWS}]))" for b in range(LSH_BANDS)
+        )
+        #be gatves per mazai informacijos, tokie skelbimai lieka be grupes
+        self.con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE dedup_new AS
+            WITH latest AS (
+                SELECT listing_code, category,
+                    {DEDUP_BLOCK} AS block,
+                    list_filter([{tokens}], x -> x IS NOT NULL) AS tokens
+                FROM listings
+                WHERE {where} AND street IS NOT NULL
+                QUALIFY row_number() OVER (PARTITION BY listing_code ORDER BY ext_date DESC, task_id DESC) = 1
+            ),
+            minhash AS (
+                SELECT listing_code, category, block, p, min(hash(token || '#' || p)) AS h
+                FROM (SELECT listing_code, category, block, unnest(tokens) AS token FROM latest), range({MINHASH_PERMUTATIONS}) r(p)
+                GROUP BY ALL
+            ),
+            signatures AS (
+                SELECT listing_code, category, block, list(h ORDER BY p) AS signature
+                FROM minhash
+                GROUP BY ALL
+            )
+            SELECT g.*
+            FROM signatures g
+            LEFT JOIN listing_signatures s USING (listing_code)
+            WHERE s.signature IS DISTINCT FROM g.signature;
+        """, params)
+
+        #naujuju juostos atskirai: is ju ir rasom i listing_lsh, ir ieskom kandidatu
+        self.con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE dedup_bands AS
+            SELECT b.band, b.bucket, n.listing_code
+            FROM dedup_new n, LATERAL (VALUES {bands}) b(band, bucket);
+        """)
+
+        with self.transaction():
+            self.con.execute("DELETE FROM listing_lsh WHERE listing_code IN (SELECT listing_code FROM dedup_new);")
+            self.con.execute("INSERT INTO listing_lsh SELECT * FROM dedup_bands;")
+            self.con.execute("""
+                INSERT INTO listing_signatures
+                SELECT listing_code, category, signature, NULL, ? FROM dedup_new
+                ON CONFLICT (listing_code) DO UPDATE SET
+                    category = excluded.category, signature = excluded.signature, updated = excluded.updated;
+            """, [self.run_date])
+            #kandidatai tik is tu paciu juostu, tikrinam parasu sutapima
+            #zvalgomasi tik naujuju juostomis (mazas hash join build), listing_lsh perskaitoma viena karta
+            self.con.execute(f"""
+                UPDATE listing_signatures s
+                SET cluster_id = c.cluster_id
+                FROM (
+                    SELECT n.listing_code, least(n.listing_code, min(coalesce(o.cluster_id, o.listing_code))) AS cluster_id
+                    FROM dedup_new n
+                    LEFT JOIN (
+                        SELECT DISTINCT a.listing_code, b.listing_code AS other_code
+                        FROM dedup_bands a
+                        JOIN listing_lsh b ON a.band = b.band AND a.bucket = b.bucket AND a.listing_code <> b.listing_code
+                    ) p ON p.listing_code = n.listing_code
+                    LEFT JOIN listing_signatures o ON o.listing_code = p.other_code
+                        AND list_sum(list_transform(range(1, {MINHASH_PERMUTATIONS + 1}),
+                            i -> CAST(o.signature[i] = n.signature[i] AS INTEGER))) >= {DUPLICATE_SIMILARITY * MINHASH_PERMUTATIONS}
+                    GROUP BY n.listing_code
+                ) c
+                WHERE s.listing_code = c.listing_code;
+            """)
+            self.con.execute(f"""
+                UPDATE listings l
+                SET cluster_id = s.cluster_id
+                FROM listing_signatures s
+                WHERE {listings_where} AND s.listing_code = l.listing_code
+                    AND l.cluster_id IS DISTINCT FROM s.cluster_id;
+            """, params)
+        new = self.con.execute("SELECT count(*) FROM dedup_new;").fetchone()[0]
+        self.con.execute("DROP TABLE dedup_bands;")
+        self.con.execute("DROP TABLE dedup_new;")
+        return new
+
+    #task'o listings eilutes (kartu su perkeltomis) paverciam pokyciais
+    #taskus reikia taikyti chronologiskai, pakartotinai pritaikytas taskas nieko nekeicia
+    def apply_changes(self, task_id=None):
+        task_id = task_id or self.task_id
+        text_exprs = ", ".join(
+            f"array_to_string({f}, ';') AS {f}" if LISTING_TYPES.get(f) == "TEXT[]" else f"CAST({f} AS TEXT) AS {f}"
+            for f in ATTR_FIELDS
+        )
+        attr_list = ", ".join(ATTR_FIELDS)
+        current_set = ",\n".join(f"{f} = excluded.{f}" for f in SCHEMA)
+        schema_list = ", ".join(SCHEMA)
+
+        self.con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE cdc_new AS
+            SELECT listing_code, {schema_list}
+            FROM listings
+            WHERE task_id = ?
+            QUALIFY row_number() OVER (PARTITION BY listing_code ORDER BY listing_id) = 1;
+        """, [task_id])
+
+        self.con.execute("BEGIN TRANSACTION;")
+        self.con.execute("""
+            INSERT INTO listing_seen
+            SELECT listing_code, ext_date, task_id, category, favorited, views FROM cdc_new
+            ON CONFLICT (listing_code, ext_date) DO UPDATE SET
+                task_id = excluded.task_id,
+                category = excluded.category,
+                favorited = excluded.favorited,
+                views = excluded.views;
+        """)
+        self.con.execute("""
+            INSERT INTO price_history
+            SELECT n.listing_code, n.ext_date, n.price, n.price_per_month, n.task_id
+            FROM cdc_new n
+            LEFT JOIN listings_current c USING (listing_code)
+            WHERE c.listing_code IS NULL
+                OR n.price IS DISTINCT FROM c.price
+                OR n.price_per_month IS DISTINCT FROM c.price_per_month
+            ON CONFLICT (listing_code, valid_from) DO UPDATE SET
+                price = excluded.price,
+                price_per_month = excluded.price_per_month,
+                task_id = excluded.task_id;
+        """)
+        #naujam skelbimui irasom visus ne NULL laukus, senam - tik pasikeitusius (ir NULL jei dingo)
+        self.con.execute(f"""
+            INSERT INTO attr_history
+            SELECT n.listing_code, n.ext_date, n.field, n.value, n.task_id
+            FROM (SELECT listing_code, ext_date, task_id, {text_exprs} FROM cdc_new)
+                UNPIVOT INCLUDE NULLS (value FOR field IN ({attr_list})) n
+            LEFT JOIN (SELECT listing_code, {text_exprs} FROM listings_current)
+                UNPIVOT INCLUDE NULLS (value FOR field IN ({attr_list})) c
+                USING (listing_code, field)
+            WHERE (c.listing_code IS NULL AND n.value IS NOT NULL)
+                OR (c.listing_code IS NOT NULL AND n.value IS DISTINCT FROM c.value)
+            ON CONFLICT (listing_code, valid_from, field) DO UPDATE SET
+                value = excluded.value,
+                task_id = excluded.task_id;
+        """)
+        self.con.execute(f"""
+            INSERT INTO listings_current
+            SELECT *, ext_date AS first_seen, ext_date AS last_seen FROM cdc_new
+            ON CONFLICT (listing_code) DO UPDATE SET
+                {current_set},
+                last_seen = excluded.last_seen
+            WHERE excluded.ext_date >= listings_current.ext_date;
+        """)
+        self.con.execute("INSERT OR REPLACE INTO cdc_tasks VALUES (?, ?);", [task_id, utcnow()])
+        self.con.execute("COMMIT;")
+        self.con.execute("DROP TABLE cdc_new;")
+
+    #pokyciai nuo since skaiciuojami is naujo, kai listings eilutes perrasytos (reparse)
+    #CDC irasai nuo since trinami, listings_current grazinamas i busena pries since (is listing_snapshots)
+    #ir jau pritaikyti taskai nuo since pritaikomi is naujo chronologiskai
+    def reapply_changes(self, since):
+        tasks = [task_id for task_id, in self.con.execute("""
+            SELECT task_id
+            FROM listings
+            WHERE ext_date >= ? AND task_id IN (SELECT task_id FROM cdc_tasks)
+            GROUP BY task_id
+            ORDER BY min(ext_date), task_id;
+        """, [since]).fetchall()]
+        schema_list = ", ".join(f"s.{f}" for f in SCHEMA)
+
+        with self.transaction():
+            self.con.execute("DELETE FROM listing_seen WHERE ext_date >= ?;", [since])
+            self.con.execute("DELETE FROM price_history WHERE valid_from >= ?;", [since])
+            self.con.execute("DELETE FROM attr_history WHERE valid_from >= ?;", [since])
+            self.con.execute(f"""
+                INSERT OR REPLACE INTO listings_current
+                SELECT c.listing_code, {schema_list}, c.first_seen, s.ext_date
+                FROM listings_current c
+                JOIN listing_snapshots s ON s.listing_code = c.listing_code
+                WHERE c.ext_date >= ?
+                QUALIFY row_number() OVER (PARTITION BY c.listing_code ORDER BY s.ext_date DESC) = 1;
+            """, [since])
+            #iki since nematyti skelbimai bus nauji
+            self.con.execute("DELETE FROM listings_current WHERE ext_date >= ?;", [since])
+            self.con.register("reapply_tasks", pd.DataFrame({"task_id": tasks}, dtype="int64"))
+            self.con.execute("DELETE FROM cdc_tasks WHERE task_id IN (SELECT task_id FROM reapply_tasks);")
+            self.con.unregister("reapply_tasks")
+
+        for task_id in tasks:
+            self.apply_changes(task_id)
+        return len(tasks)
+
+    #perskaiciuoja agregatus tik toms (ext_date, category) dalims kurias palieste task'as
+    #dienos dalis skaiciuojama is naujo, tai pakartotinis run'as ta pacia diena nedubliuoja
+    def update_market_stats(self, task_id=None):
+        self.refresh_market(
+            "SELECT DISTINCT ext_date, category FROM listings WHERE task_id = ?",
+            [task_id or self.task_id],
+        )
+
+    #visoms dienoms, suspaustos dienos skaiciuojamos is listing_snapshots
+    def rebuild_market_stats(self):
+        source = listings_source_sql(self.con)
+        self.refresh_market(f"SELECT DISTINCT ext_date, category FROM {source}", [], source)
+
+    def refresh_market(self, parts_sql, params, source="listings"):
+        metrics = ", ".join(f"('{name}', {expr})" for name, expr in MARKET_METRICS.items())
+        self.con.execute(f"CREATE OR REPLACE TEMP TABLE market_parts AS {parts_sql};", params)
+        #ta pati diena gali buti keliuose taskuose, imam naujausia skelbimo eilute
+        #artimi dublikatai (tas pats cluster_id) skaiciuojami viena karta
+        self.con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE market_rows AS
+            SELECT l.ext_date, l.category, coalesce(l.city, '') AS city, coalesce(l.hood, '') AS hood, m.metric, m.value
+            FROM (
+                SELECT l.*
+                FROM {source} l
+                JOIN market_parts USING (ext_date, category)
+                QUALIFY row_number() OVER (
+                    PARTITION BY l.ext_date, coalesce(l.cluster_id, l.listing_code)
+                    ORDER BY l.task_id DESC, l.listing_id
+                ) = 1
+            ) l,
+            LATERAL (VALUES {metrics}) m(metric, value)
+            WHERE m.value > 0;
+        """)
+
+        self.con.execute("BEGIN TRANSACTION;")
+        for table in ["market_daily", "market_sketch"]:
+            self.con.execute(f"""
+                DELETE FROM {table} t
+                USING market_parts p
+                WHERE t.ext_date = p.ext_date AND t.category = p.category;
+            """)
+        self.con.execute("""
+            INSERT INTO market_daily
+            SELECT ext_date, category, city, hood, metric, count(*), sum(value), min(value), max(value)
+            FROM market_rows
+            GROUP BY ALL;
+        """)
+        self.con.execute("""
+            INSERT INTO market_sketch
+            SELECT ext_date, category, city, hood, metric, CAST(ceil(ln(value) / ln(?)) AS INTEGER) AS bucket, count(*)
+            FROM market_rows
+            GROUP BY ALL;
+        """, [SKETCH_GAMMA])
+        self.con.execute("COMMIT;")
+        self.con.execute("DROP TABLE market_rows;")
+        self.con.execute("DROP TABLE market_parts;")
+
+    #taskai kuriu listings eilutes dar nepaverstos pokyciais (pvz. senos db), seniausi pirmi
+    def pending_change_tasks(self):
+        return [task_id for task_id, in self.con.execute("""
+            SELECT task_id
+            FROM listings
+            WHERE task_id NOT IN (SELECT task_id FROM cdc_tasks)
+            GROUP BY task_id
+            ORDER BY min(ext_date), task_id;
+        """).fetchall()]
+
+    #istrina pilnas listings eilutes iki datos, jos lieka atkuriamos per listing_snapshots
+    #paliekam paskutinius snapshot'us, nes is ju carry_forward kopijuoja
+    def compact_listings(self, until):
+        removed = self.con.execute("""
+            DELETE FROM listings
+            WHERE ext_date <= CAST(? AS DATE)
+                AND task_id IN (SELECT task_id FROM cdc_tasks)
+                AND listing_id NOT IN (SELECT last_listing_id FROM url_index WHERE last_listing_id IS NOT NULL);
+        """, [until]).fetchone()[0]
+        self.con.execute("INSERT INTO compactions VALUES (?, ?, ?);", [until, removed, utcnow()])
+        self.con.execute("CHECKPOINT;")
+        return removed
+
+    #HtmlArchive buferis: pages - archive_pages eilutes, bodies - {sha256: html}
+    #rasom tik tuos turinius kuriu dar nera archyve
+    def insert_archive(self, pages, bodies, folder):
+        self.con.register("archive_new", pd.DataFrame({"sha256": list(bodies), "body": list(bodies.values())}))
+        new_blobs = "SELECT sha256, body FROM archive_new WHERE sha256 NOT IN (SELECT sha256 FROM archive_blobs)"
+        if self.con.execute(f"SELECT count(*) FROM ({new_blobs});").fetchone()[0] > 0:
+            path = Path(folder) / "blobs" / f"fetch_date={self.run_date}" / f"{uuid.uuid4().hex}.parquet"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.con.execute(f"COPY ({new_blobs}) TO '{path}' (FORMAT PARQUET, COMPRESSION ZSTD);")
+            self.con.execute(f"INSERT INTO archive_blobs SELECT sha256, ? FROM ({new_blobs});", [str(path)])
+        self.con.unregister("archive_new")
+
+        self.con.register("archive_pages_new", pd.DataFrame(pages, columns=ARCHIVE_PAGE_COLUMNS))
+        self.con.execute("INSERT INTO archive_pages BY NAME SELECT * FROM archive_pages_new;")
+        self.con.unregister("archive_pages_new")
+
+    #po finalize atnaujinam indeksa siandien parsiustiems skelbimams
+    def update_url_index(self, cards, task_id=None):
+        self.con.register("cards", pd.DataFrame(cards, columns=["listing_code", "url", "card_hash"]))
+
+        self.con.execute("""
+            INSERT INTO url_index
+            SELECT c.listing_code, c.url, s.category, c.card_hash, s.listing_id, ?, ?
+            FROM listings_stg s
+            JOIN cards c ON c.listing_code = split_part(s.url, '/', 2)
+            WHERE s.task_id = CAST(? AS TEXT)
+            QUALIFY row_number() OVER (PARTITION BY c.listing_code) = 1
+            ON CONFLICT (listing_code) DO UPDATE SET
+                url = excluded.url,
+                category = excluded.category,
+                card_hash = excluded.card_hash,
+                last_listing_id = excluded.last_listing_id,
+                last_fetch = excluded.last_fetch,
+                last_seen = excluded.last_seen;
+        """, [utcnow(), self.run_date, task_id or self.task_id])
+        self.con.unregister("cards")
+
+    #ParseDiagnostics.rows() i parse_stats, pratesto task'o reiksmes sumuojamos
+    def save_parse_stats(self, rows, task_id=None):
+        if len(rows) == 0:
+            return
+        df = pd.DataFrame(rows, columns=["kind", "name", "value"])
+        df.insert(0, "task_id", task_id or self.task_id)
+        self.con.register("parse_stats_new", df)
+        self.con.execute("""
+            INSERT INTO parse_stats BY NAME SELECT * FROM parse_stats_new
+            ON CONFLICT (task_id, kind, name) DO UPDATE SET
+                value = CASE WHEN excluded.name = 'max_seconds'
+                    THEN greatest(parse_stats.value, excluded.value)
+                    ELSE parse_stats.value + excluded.value END;
+        """)
+        self.con.unregister("parse_stats_new")
+
+    #TaskMetrics.rows() i task_metrics, pratesto task'o reiksmes sumuojamos
+    def save_task_metrics(self, rows, task_id=None):
+        if len(rows) == 0:
+            return
+        df = pd.DataFrame(rows, columns=["kind", "name", "value"])
+        df.insert(0, "task_id", task_id or self.task_id)
+        self.con.register("task_metrics_new", df)
+        self.con.execute("""
+            INSERT INTO task_metrics BY NAME SELECT * FROM task_metrics_new
+            ON CONFLICT (task_id, kind, name) DO UPDATE SET
+                value = task_metrics.value + excluded.value;
+        """)
+        self.con.unregister("task_metrics_new")
 
     #Close the connection
     def close(self):
@@ -123,14 +1122,241 @@ class DBManager:
             self.con.close()
 
 
+#kaupia istrauktas eilutes stulpeliais, kad nereiketu kiekvienai eilutei atskiro INSERT
+class BatchWriter:
+    def __init__(self, db: DBManager, category, flush_rows=FLUSH_ROWS, task_id=None):
+        self.db = db
+        self.category = category
+        self.task_id = task_id
+        self.flush_rows = flush_rows
+        self.columns = {field: [] for field in SCHEMA}
+        self.pending = 0
+        #(url, status) frontier lentelei, irasoma kartu su eilutemis
+        self.url_status = []
+        #kiek is viso eiluciu imesta per visa kategorija
+        self.records = 0
+        #kiek kartu ir kiek laiko rasyta i db, metrikoms
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        #dar neirasyta parse_stats dalis, irasoma kartu su eilutemis
+        self.diagnostics = ParseDiagnostics()
+
+    #parse - (seconds, unknown_labels, error) is parse_listing_diag, jei puslapis buvo parsintas
+    def parsed(self, row_dict, parse):
+        if parse is not None:
+            self.diagnostics.add(row_dict, *parse)
+
+    #link - skelbimo nuoroda kaip frontier lenteleje
+    def add(self, row_dict: dict, link=None):
+        row_dict["listing_id"] = extract_listing_id(row_dict.get("url"), self.db.run_date)
+        row_dict["task_id"] = self.task_id
+        row_dict["ext_date"] = self.db.run_date
+        row_dict["category"] = self.category
+
+        for field in SCHEMA:
+            self.columns[field].append(row_dict.get(field))
+        self.pending += 1
+        self.mark(link, "done")
+
+    #skelbimas be eilutes (nepavyko parsisiusti ar istraukti)
+    def mark(self, link, status):
+        if link is not None:
+            self.url_status.append((link, status))
+
+        if self.pending >= self.flush_rows or len(self.url_status) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending == 0 and len(self.url_status) == 0 and self.diagnostics.pages == 0:
+            return
+        started = time.perf_counter()
+        self.db.insert_checkpoint(self.columns, self.task_id, self.url_status, self.diagnostics.rows())
+        self.diagnostics = ParseDiagnostics()
+        self.flush_seconds += time.perf_counter() - started
+        self.flushes += 1
+        self.records += self.pending
+        self.columns = {field: [] for field in SCHEMA}
+        self.pending = 0
+        self.url_status = []
+
+
+#db darbai atskirame threade, kad event loop (fetch'ai) nestovetu kol rasoma ar finalizuojama.
+#crawl metu visi db kvietimai eina per cia, tai db (ar DBClient) naudoja tik vienas threadas.
+#eile ribota: kai pilna, laukia tik ta korutina kuri deda darba, ne visas loop
+class AsyncWriter:
+    def __init__(self, db, queue_size=WRITE_QUEUE_SIZE, batch=WRITE_BATCH):
+        self.db = db
+        self.batch = batch
+        self.loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(queue_size)
+        self.queue = queue.Queue()
+        #statistika logui
+        self.calls = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self.serve, name="db-writer", daemon=True)
+        self.thread.start()
+
+    #fn(*args) rasytojo threade, grazina concurrent Future - laukti nebutina,
+    #tada fn pati turi susitvarkyti su klaidomis
+    async def submit(self, fn, *args, **kwargs):
+        await self.slots.acquire()
+        future = concurrent.futures.Future()
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.slots.release))
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    #kaip submit, bet laukiam rezultato (plan_fetch, lease_work ir pan.)
+    async def call(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(await self.submit(fn, *args, **kwargs))
+
+    #darbai vykdomi eiles tvarka, tai grizus visi anksciau idieti jau atlikti
+    async def join(self):
+        await self.call(lambda: None)
+
+    #ima viska kas susikaupe eileje (iki batch) ir vykdo is eiles
+    def serve(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            for item in items:
+                if item is None:
+                    return
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as err:
+                    future.set_exception(err)
+                self.calls += 1
+            self.batches += 1
+            self.busy_seconds += time.perf_counter() - started
+
+    #kviesti po join, kol loop dar veikia
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        return f"{self.calls} calls in {self.batches} batches, {self.busy_seconds:.2f}s busy"
+
+
+#kasdieniai snapshot'ai is CDC lenteliu, stulpeliai ir tipai kaip listings
+#vienai dienai imama paskutine kiekvieno lauko reiksme ne velesne uz ta diena
+#attr_history pokyciai suvedami i busenas (viena eilute listing_code x pokycio diena, visi laukai),
+#tada kiekvienai dienai viena ASOF join - darbas auga su dienu ir pokyciu skaiciumi, o ne dienos x istorija
+#reiksme laikoma struct'e, kad isvalytas laukas (NULL) nebutu praleistas per IGNORE NULLS
+def snapshots_view_sql():
+    changes = ",\n".join(
+        f"any_value(struct_pack(v := value)) FILTER (WHERE field = '{f}') AS {f}" for f in ATTR_FIELDS
+    )
+    states = ",\n".join(f"last_value({f} IGNORE NULLS) OVER w AS {f}" for f in ATTR_FIELDS)
+    values = {}
+    for field in SCHEMA:
+        field_type = LISTING_TYPES.get(field, "TEXT")
+        if field == "listing_id":
+            values[field] = "s.listing_code || '_' || strftime(s.ext_date, '%Y-%m-%d')"
+        elif field in SEEN_FIELDS:
+            values[field] = f"s.{field}"
+        elif field in PRICE_FIELDS:
+            values[field] = f"p.{field}"
+        elif field_type == "TEXT":
+            values[field] = f"a.{field}.v"
+        elif field_type == "TEXT[]":
+            values[field] = f"string_split(NULLIF(a.{field}.v, ''), ';')"
+        else:
+            values[field] = f"TRY_CAST(a.{field}.v AS {field_type})"
+    exprs = [f"{values[field]} AS {field}" for field in SCHEMA]
+    #listing_code jau yra listing_seen, is listing_id jo neskaidom
+    values["listing_code"] = "s.listing_code"
+    exprs += [f"{values[field] if field in values else template.format(**values)} AS {field}" for field, template in DERIVED_SQL.items()]
+    return f"""CREATE OR REPLACE VIEW listing_snapshots AS
+WITH changes AS (
+SELECT listing_code, valid_from,
+{changes}
+FROM attr_history
+GROUP BY listing_code, valid_from
+),
+states AS (
+SELECT listing_code, valid_from,
+{states}
+FROM changes
+WINDOW w AS (PARTITION BY listing_code ORDER BY valid_from)
+)
+SELECT {", ".join(exprs)}
+FROM listing_seen s
+ASOF LEFT JOIN states a ON a.listing_code = s.listing_code AND s.ext_date >= a.valid_from
+ASOF LEFT JOIN price_history p ON p.listing_code = s.listing_code AND s.ext_date >= p.valid_from;"""
+
+
+#paskutine suspausta diena, None jei compact dar nebuvo (ar senesne db be compactions lenteles)
+def compacted_until(con):
+    exists = con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'compactions';").fetchone()[0]
+    return con.execute("SELECT max(until) FROM compactions;").fetchone()[0] if exists else None
+
+
+#listings su suspaustomis dienomis: iki compacted_until eilutes atkuriamos is listing_snapshots
+#(cluster_id is listing_signatures), veliau - is listings. be compact tiesiog listings
+def listings_source_sql(con):
+    until = compacted_until(con)
+    if until is None:
+        return "listings"
+    return f"""(
+        SELECT * FROM listings WHERE ext_date > DATE '{until}'
+        UNION ALL BY NAME
+        SELECT s.*, g.cluster_id
+        FROM listing_snapshots s
+        LEFT JOIN listing_signatures g ON g.listing_code = s.listing_code
+        WHERE s.ext_date <= DATE '{until}'
+    )"""
+
+
+#seni taskai paverciami pokyciais ir pilnos listings eilutes iki until istrinamos
+#until None - tik papildom CDC lenteles, nieko netrinam
+def compact(until=None, db_path="vilnius.db"):
+    db = DBManager(db_path)
+    db.ensure_schema()
+    tasks = db.pending_change_tasks()
+    for task_id in tasks:
+        db.apply_changes(task_id)
+    removed = db.compact_listings(until) if until else 0
+    db.close()
+    return len(tasks), removed
+
+
+#artimu dublikatu indeksas visiems skelbimams (senai db), po to agregatai be dublikatu
+def dedup(db_path="vilnius.db"):
+    db = DBManager(db_path)
+    db.ensure_schema()
+    updated = db.update_clusters()
+    db.rebuild_market_stats()
+    clusters, listings = db.con.execute("""
+        SELECT count(DISTINCT cluster_id), count(*) FROM listing_signatures;
+    """).fetchone()
+    db.close()
+    return updated, clusters, listings
+
+
+#laikas be zonos, kad butu galima lyginti su TIMESTAMP stulpeliais
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 #helper funkcija unikaliu id generavimui
-def extract_listing_id(url: str) -> str:
+#day - run'o data, pratesiant nutraukta run'a ji gali buti ne siandien
+def extract_listing_id(url: str, day=None) -> str:
     #Return id like '2-1679105_2025-11-13'
     if not url:
         return None
     listing_code = url.split("/")[1]
 
     #timeseries data unique id
-    today = date.today().isoformat()
+    today = (day or date.today()).isoformat()
     return f"{listing_code}_{today}"
 
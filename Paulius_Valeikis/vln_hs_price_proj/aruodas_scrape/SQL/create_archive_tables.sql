@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS archive_blobs (
+    sha256 TEXT,
+    file TEXT,
+    PRIMARY KEY (sha256)
+);
+CREATE TABLE IF NOT EXISTS archive_pages (
+    url TEXT,
+    listing_code TEXT,
+    fetch_date DATE,
+    category TEXT,
+    kind TEXT,
+    task_id BIGINT,
+    sha256 TEXT
+);
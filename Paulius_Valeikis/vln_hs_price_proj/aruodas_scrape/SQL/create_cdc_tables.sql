@@ -0,0 +1,35 @@
+CREATE TABLE IF NOT EXISTS listing_seen (
+    listing_code TEXT,
+    ext_date DATE,
+    task_id BIGINT,
+    category TEXT,
+    favorited INTEGER,
+    views INTEGER,
+    PRIMARY KEY (listing_code, ext_date)
+);
+CREATE TABLE IF NOT EXISTS price_history (
+    listing_code TEXT,
+    valid_from DATE,
+    price DOUBLE,
+    price_per_month DOUBLE,
+    task_id BIGINT,
+    PRIMARY KEY (listing_code, valid_from)
+);
+CREATE TABLE IF NOT EXISTS attr_history (
+    listing_code TEXT,
+    valid_from DATE,
+    field TEXT,
+    value TEXT,
+    task_id BIGINT,
+    PRIMARY KEY (listing_code, valid_from, field)
+);
+CREATE TABLE IF NOT EXISTS cdc_tasks (
+    task_id BIGINT,
+    applied TIMESTAMP,
+    PRIMARY KEY (task_id)
+);
+CREATE TABLE IF NOT EXISTS compactions (
+    until DATE,
+    removed BIGINT,
+    compacted TIMESTAMP
+);
@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS listing_signatures (
+    listing_code TEXT,
+    category TEXT,
+    signature UBIGINT[],
+    cluster_id TEXT,
+    updated DATE,
+    PRIMARY KEY (listing_code)
+);
+CREATE TABLE IF NOT EXISTS listing_lsh (
+    band INTEGER,
+    bucket UBIGINT,
+    listing_code TEXT,
+    PRIMARY KEY (band, bucket, listing_code)
+);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    sink TEXT,
+    last_task_id BIGINT,
+    exported_at TIMESTAMP,
+    rows BIGINT,
+    PRIMARY KEY (sink)
+);
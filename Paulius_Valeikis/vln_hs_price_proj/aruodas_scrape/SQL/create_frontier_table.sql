@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS frontier (
+    task_id BIGINT,
+    url TEXT,
+    kind TEXT,
+    listing_code TEXT,
+    card_hash TEXT,
+    status TEXT,
+    updated TIMESTAMP,
+    PRIMARY KEY (task_id, url)
+);
@@ -0,0 +1,42 @@
+CREATE TABLE IF NOT EXISTS listings_current (
+            
+listing_code TEXT,
+listing_id TEXT,
+task_id BIGINT,
+category TEXT,
+ext_date DATE,
+city TEXT,
+hood TEXT,
+street TEXT,
+price DOUBLE,
+price_per_month DOUBLE,
+house_number TEXT,
+flat_number TEXT,
+rooms INTEGER,
+area_sqm DOUBLE,
+plot_area DOUBLE,
+floor INTEGER,
+floor_total INTEGER,
+year_of_creation INTEGER,
+interior TEXT,
+building_type TEXT,
+house_type TEXT,
+heating TEXT,
+peculiars TEXT[],
+extra_spaces TEXT[],
+extra_equipment TEXT[],
+security TEXT,
+window_orientation TEXT[],
+building_energy_class TEXT,
+url TEXT,
+entry_date DATE,
+redacted_date DATE,
+active_till_date DATE,
+favorited INTEGER,
+views INTEGER,
+water TEXT,
+distance_to_water DOUBLE,
+closest_water TEXT,
+first_seen DATE,
+last_seen DATE,
+PRIMARY KEY (listing_code));
\ No newline at end of file
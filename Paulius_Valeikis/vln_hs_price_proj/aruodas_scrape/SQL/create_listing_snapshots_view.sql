@@ -0,0 +1,71 @@
+CREATE OR REPLACE VIEW listing_snapshots AS
+WITH changes AS (
+SELECT listing_code, valid_from,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'city') AS city,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'hood') AS hood,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'street') AS street,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'house_number') AS house_number,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'flat_number') AS flat_number,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'rooms') AS rooms,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'area_sqm') AS area_sqm,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'plot_area') AS plot_area,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'floor') AS floor,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'floor_total') AS floor_total,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'year_of_creation') AS year_of_creation,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'interior') AS interior,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'building_type') AS building_type,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'house_type') AS house_type,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'heating') AS heating,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'peculiars') AS peculiars,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'extra_spaces') AS extra_spaces,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'extra_equipment') AS extra_equipment,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'security') AS security,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'window_orientation') AS window_orientation,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'building_energy_class') AS building_energy_class,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'url') AS url,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'entry_date') AS entry_date,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'redacted_date') AS redacted_date,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'active_till_date') AS active_till_date,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'water') AS water,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'distance_to_water') AS distance_to_water,
+any_value(struct_pack(v := value)) FILTER (WHERE field = 'closest_water') AS closest_water
+FROM attr_history
+GROUP BY listing_code, valid_from
+),
+states AS (
+SELECT listing_code, valid_from,
+last_value(city IGNORE NULLS) OVER w AS city,
+last_value(hood IGNORE NULLS) OVER w AS hood,
+last_value(street IGNORE NULLS) OVER w AS street,
+last_value(house_number IGNORE NULLS) OVER w AS house_number,
+last_value(flat_number IGNORE NULLS) OVER w AS flat_number,
+last_value(rooms IGNORE NULLS) OVER w AS rooms,
+last_value(area_sqm IGNORE NULLS) OVER w AS area_sqm,
+last_value(plot_area IGNORE NULLS) OVER w AS plot_area,
+last_value(floor IGNORE NULLS) OVER w AS floor,
+last_value(floor_total IGNORE NULLS) OVER w AS floor_total,
+last_value(year_of_creation IGNORE NULLS) OVER w AS year_of_creation,
+last_value(interior IGNORE NULLS) OVER w AS interior,
+last_value(building_type IGNORE NULLS) OVER w AS building_type,
+last_value(house_type IGNORE NULLS) OVER w AS house_type,
+last_value(heating IGNORE NULLS) OVER w AS heating,
+last_value(peculiars IGNORE NULLS) OVER w AS peculiars,
+last_value(extra_spaces IGNORE NULLS) OVER w AS extra_spaces,
+last_value(extra_equipment IGNORE NULLS) OVER w AS extra_equipment,
+last_value(security IGNORE NULLS) OVER w AS security,
+last_value(window_orientation IGNORE NULLS) OVER w AS window_orientation,
+last_value(building_energy_class IGNORE NULLS) OVER w AS building_energy_class,
+last_value(url IGNORE NULLS) OVER w AS url,
+last_value(entry_date IGNORE NULLS) OVER w AS entry_date,
+last_value(redacted_date IGNORE NULLS) OVER w AS redacted_date,
+last_value(active_till_date IGNORE NULLS) OVER w AS active_till_date,
+last_value(water IGNORE NULLS) OVER w AS water,
+last_value(distance_to_water IGNORE NULLS) OVER w AS distance_to_water,
+last_value(closest_water IGNORE NULLS) OVER w AS closest_water
+FROM changes
+WINDOW w AS (PARTITION BY listing_code ORDER BY valid_from)
+)
+SELECT s.listing_code || '_' || strftime(s.ext_date, '%Y-%m-%d') AS listing_id, s.task_id AS task_id, s.category AS category, s.ext_date AS ext_date, a.city.v AS city, a.hood.v AS hood, a.street.v AS street, p.price AS price, p.price_per_month AS price_per_month, a.house_number.v AS house_number, a.flat_number.v AS flat_number, TRY_CAST(a.rooms.v AS INTEGER) AS rooms, TRY_CAST(a.area_sqm.v AS DOUBLE) AS area_sqm, TRY_CAST(a.plot_area.v AS DOUBLE) AS plot_area, TRY_CAST(a.floor.v AS INTEGER) AS floor, TRY_CAST(a.floor_total.v AS INTEGER) AS floor_total, TRY_CAST(a.year_of_creation.v AS INTEGER) AS year_of_creation, a.interior.v AS interior, a.building_type.v AS building_type, a.house_type.v AS house_type, a.heating.v AS heating, string_split(NULLIF(a.peculiars.v, ''), ';') AS peculiars, string_split(NULLIF(a.extra_spaces.v, ''), ';') AS extra_spaces, string_split(NULLIF(a.extra_equipment.v, ''), ';') AS extra_equipment, a.security.v AS security, string_split(NULLIF(a.window_orientation.v, ''), ';') AS window_orientation, a.building_energy_class.v AS building_energy_class, a.url.v AS url, TRY_CAST(a.entry_date.v AS DATE) AS entry_date, TRY_CAST(a.redacted_date.v AS DATE) AS redacted_date, TRY_CAST(a.active_till_date.v AS DATE) AS active_till_date, s.favorited AS favorited, s.views AS views, a.water.v AS water, TRY_CAST(a.distance_to_water.v AS DOUBLE) AS distance_to_water, a.closest_water.v AS closest_water, round(p.price / NULLIF(TRY_CAST(a.area_sqm.v AS DOUBLE), 0), 2) AS price_per_sqm, s.listing_code AS listing_code
+FROM listing_seen s
+ASOF LEFT JOIN states a ON a.listing_code = s.listing_code AND s.ext_date >= a.valid_from
+ASOF LEFT JOIN price_history p ON p.listing_code = s.listing_code AND s.ext_date >= p.valid_from;
\ No newline at end of file
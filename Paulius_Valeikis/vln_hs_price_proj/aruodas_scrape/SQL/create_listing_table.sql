@@ -1,38 +1,41 @@
 CREATE TABLE IF NOT EXISTS listings (
             
 listing_id TEXT,
-task_id TEXT,
+task_id BIGINT,
 category TEXT,
-ext_date TEXT,
+ext_date DATE,
 city TEXT,
 hood TEXT,
 street TEXT,
-price TEXT,
-price_per_month TEXT,
+price DOUBLE,
+price_per_month DOUBLE,
 house_number TEXT,
 flat_number TEXT,
-rooms TEXT,
-area_sqm TEXT,
-plot_area TEXT,
-floor TEXT,
-floor_total TEXT,
-year_of_creation TEXT,
+rooms INTEGER,
+area_sqm DOUBLE,
+plot_area DOUBLE,
+floor INTEGER,
+floor_total INTEGER,
+year_of_creation INTEGER,
 interior TEXT,
 building_type TEXT,
 house_type TEXT,
 heating TEXT,
-peculiars TEXT,
-extra_spaces TEXT,
-extra_equipment TEXT,
+peculiars TEXT[],
+extra_spaces TEXT[],
+extra_equipment TEXT[],
 security TEXT,
-window_orientation TEXT,
+window_orientation TEXT[],
 building_energy_class TEXT,
 url TEXT,
-entry_date TEXT,
-redacted_date TEXT,
-active_till_date TEXT,
-favorited TEXT,
-views TEXT,
+entry_date DATE,
+redacted_date DATE,
+active_till_date DATE,
+favorited INTEGER,
+views INTEGER,
 water TEXT,
-distance_to_water TEXT,
-closest_water TEXT);
\ No newline at end of file
+distance_to_water DOUBLE,
+closest_water TEXT,
+price_per_sqm DOUBLE,
+listing_code TEXT,
+cluster_id TEXT);
\ No newline at end of file
@@ -0,0 +1,22 @@
+CREATE TABLE IF NOT EXISTS market_daily (
+    ext_date DATE,
+    category TEXT,
+    city TEXT,
+    hood TEXT,
+    metric TEXT,
+    n BIGINT,
+    total DOUBLE,
+    min_value DOUBLE,
+    max_value DOUBLE,
+    PRIMARY KEY (ext_date, category, city, hood, metric)
+);
+CREATE TABLE IF NOT EXISTS market_sketch (
+    ext_date DATE,
+    category TEXT,
+    city TEXT,
+    hood TEXT,
+    metric TEXT,
+    bucket INTEGER,
+    n BIGINT,
+    PRIMARY KEY (ext_date, category, city, hood, metric, bucket)
+);
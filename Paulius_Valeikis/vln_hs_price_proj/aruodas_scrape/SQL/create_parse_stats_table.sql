@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS parse_stats (
+    task_id BIGINT,
+    kind TEXT,
+    name TEXT,
+    value DOUBLE,
+    PRIMARY KEY (task_id, kind, name)
+);
@@ -2,6 +2,7 @@ CREATE TABLE IF NOT EXISTS tasks (
     task_id BIGINT DEFAULT nextval('serial'),
     run_date DATE,
     category TEXT,
+    city TEXT,
     start_time TIMESTAMP,
     end_time TIMESTAMP,
     status TEXT,
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS url_index (
+    listing_code TEXT,
+    url TEXT,
+    category TEXT,
+    card_hash TEXT,
+    last_listing_id TEXT,
+    last_fetch TIMESTAMP,
+    last_seen DATE,
+    PRIMARY KEY (listing_code)
+);
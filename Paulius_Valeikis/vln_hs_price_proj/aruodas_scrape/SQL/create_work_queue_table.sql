@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS work_queue (
+    task_id BIGINT,
+    page INTEGER,
+    kind TEXT,
+    city TEXT,
+    category TEXT,
+    url TEXT,
+    status TEXT,
+    worker TEXT,
+    lease_until TIMESTAMP,
+    attempts INTEGER,
+    error TEXT,
+    updated TIMESTAMP,
+    PRIMARY KEY (task_id, page)
+);
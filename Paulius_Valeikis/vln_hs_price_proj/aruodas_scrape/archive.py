@@ -0,0 +1,129 @@
+import hashlib
+import multiprocessing
+import time
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+from logger import logger
+from .DB_manage import DBManager, compacted_until
+from .html_parse import SCHEMA, DEFAULT_BACKEND, listing_code, parse_listing
+
+#visi parsiusti puslapiai saugomi cia kaip zstd parquet failai
+#vienas turinys (sha256) saugomas tik viena karta, archive_pages sako kur ir kada jis buvo gautas
+ARCHIVE_DIR = "html_archive"
+#kiek puslapiu kaupiam atmintyje pries rasant viena parquet faila
+ARCHIVE_FLUSH = 200
+#kiek listings eiluciu perparsinam vienu kartu
+REPARSE_BATCH = 2000
+#kiek puslapiu vienu kartu siunciam i kiekviena procesa
+REPARSE_CHUNK = 16
+
+
+class HtmlArchive:
+    def __init__(self, db: DBManager, folder=ARCHIVE_DIR, flush_pages=ARCHIVE_FLUSH):
+        self.db = db
+        self.folder = Path(folder)
+        self.flush_pages = flush_pages
+        self.pages = []
+        self.bodies = {}
+
+    #kind - "index" arba "listing"
+    def add(self, url, category, kind, task_id, html):
+        sha256 = hashlib.sha256(html.encode("utf-8")).hexdigest()
+        code = listing_code(url) if kind == "listing" else None
+        self.pages.append((url, code, self.db.run_date, category, kind, task_id, sha256))
+        self.bodies[sha256] = html
+
+        if len(self.pages) >= self.flush_pages:
+            self.flush()
+
+    def flush(self):
+        if len(self.pages) == 0:
+            return
+        self.db.insert_archive(self.pages, self.bodies, str(self.folder))
+        self.pages = []
+        self.bodies = {}
+
+
+#procesu pool'ui, blogas puslapis neturi sustabdyti viso reparse
+def parse_or_none(html, backend=DEFAULT_BACKEND):
+    try:
+        return parse_listing(html, backend)
+    except Exception:
+        return None
+
+
+#is naujo istraukia listings eilutes is archyvo, be jokiu requestu
+#kiekvienai listings eilutei imamas naujausias archyvuotas to skelbimo puslapis ne velesnis nei ext_date
+def reparse(since=None, until=None, parser=DEFAULT_BACKEND, db_path="vilnius.db"):
+    started = time.perf_counter()
+    db = DBManager(db_path)
+    db.ensure_schema()
+    #suspaustu dienu listings eiluciu nebera, o ju CDC perrasyti negalim
+    compacted = compacted_until(db.con)
+    if compacted is not None and (since is None or date.fromisoformat(str(since)) <= compacted):
+        logger.info(f"reparse: days up to {compacted} are compacted, starting from {compacted + timedelta(days=1)}")
+        since = compacted + timedelta(days=1)
+
+    targets = db.con.execute("""
+        SELECT l.listing_id, l.task_id, l.category, l.ext_date, p.sha256, b.file
+        FROM listings l
+        ASOF JOIN (SELECT * FROM archive_pages WHERE kind = 'listing') p
+            ON p.listing_code = l.listing_code AND l.ext_date >= p.fetch_date
+        JOIN archive_blobs b USING (sha256)
+        WHERE l.ext_date >= coalesce(CAST(? AS DATE), l.ext_date)
+            AND l.ext_date <= coalesce(CAST(? AS DATE), l.ext_date)
+        ORDER BY b.file, p.sha256;
+    """, [since, until]).fetchall()
+    logger.info(f"reparse: {len(targets)} listings rows have archived pages")
+
+    parsed_pages = 0
+    rows = 0
+    pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    for i in range(0, len(targets), REPARSE_BATCH):
+        batch = targets[i:i + REPARSE_BATCH]
+        files = sorted({file for *_, file in batch})
+        hashes = pd.DataFrame({"sha256": sorted({sha256 for *_, sha256, _ in batch})})
+
+        db.con.register("reparse_hashes", hashes)
+        bodies = db.con.execute(f"""
+            SELECT sha256, body
+            FROM read_parquet({files!r})
+            WHERE sha256 IN (SELECT sha256 FROM reparse_hashes);
+        """).fetchall()
+        db.con.unregister("reparse_hashes")
+
+        #vienodas turinys parsinamas tik viena karta
+        parsed = dict(zip(
+            [sha256 for sha256, _ in bodies],
+            pool.map(parse_or_none, [body for _, body in bodies], [parser] * len(bodies), chunksize=REPARSE_CHUNK),
+        ))
+        parsed_pages += len(parsed)
+
+        columns = {field: [] for field in SCHEMA}
+        for listing_id, task_id, category, ext_date, sha256, _ in batch:
+            row = parsed.get(sha256)
+            if row is None:
+                continue
+            row = dict(row, listing_id=listing_id, task_id=task_id, category=category, ext_date=ext_date)
+            for field in SCHEMA:
+                columns[field].append(row.get(field))
+            rows += 1
+        db.replace_listings(columns)
+
+    #perparsinti laukai keicia parasus, nepasikeite neperskaiciuojami
+    db.update_clusters()
+    #CDC ir agregatai nuo pirmos perrasytos dienos
+    if rows > 0:
+        first_day = min(ext_date for _, _, _, ext_date, _, _ in targets)
+        last_day = max(ext_date for _, _, _, ext_date, _, _ in targets)
+        reapplied = db.reapply_changes(first_day)
+        db.refresh_market(
+            "SELECT DISTINCT ext_date, category FROM listings WHERE ext_date BETWEEN ? AND ?",
+            [first_day, last_day],
+        )
+        logger.info(f"reparse: changes reapplied for {reapplied} tasks since {first_day}")
+    pool.shutdown()
+    db.close()
+    logger.info(f"reparse done in {time.perf_counter() - started:.1f}s: {parsed_pages} pages parsed, {rows} rows rebuilt")
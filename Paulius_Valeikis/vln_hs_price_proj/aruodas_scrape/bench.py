@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from . import extractor
+from .DB_manage import DBManager
+from .html_parse import SCHEMA, PARSER_BACKENDS, DEFAULT_BACKEND, make_html_ext
+from .pipeline_db import Pipeline
+from .standin import STANDIN_PAGES, STANDIN_PER_PAGE, STANDIN_PORT, StandinSite
+
+#repo'je laikomi aruodas puslapiu pavyzdziai (indeksas, butai, nuoma, namas) parseriu palyginimui
+PARSER_FIXTURES = "aruodas_scrape/fixtures"
+
+#benchmarkai greiciui matuoti, leisti is projekto root:
+#python -m aruodas_scrape.bench writer --rows 5000
+#python -m aruodas_scrape.bench parser
+#python -m aruodas_scrape.bench e2e --pages 5 --latency 0.05 --error-rate 0.02 --save e2e.json
+
+
+#sugeneruoja netikras eilutes panasias i Html_ext.ext_data rezultata
+def fake_rows(n):
+    rows = []
+    for i in range(n):
+        row = {k: None for k in SCHEMA}
+        row.update({
+            "city": "Vilnius",
+            "hood": "Antakalnis",
+            "street": "Sapiegos g.",
+            "price": f"{100000 + i} €",
+            "rooms": "2",
+            "area_sqm": "54,3 m²",
+            "floor": "3",
+            "floor_total": "5",
+            "peculiars": "Nauja kanalizacija;Varžytynės",
+            "url": f"m.aruodas.lt/2-{i}",
+            "entry_date": "2025-10-01",
+            "views": "1234/12",
+        })
+        rows.append(row)
+    return rows
+
+
+def bench_writer(n):
+    results = {}
+
+    #senas budas: viena eilute - vienas INSERT
+    db = DBManager(":memory:")
+    db.ensure_schema()
+    db.start_task(category="BENCH")
+    rows = fake_rows(n)
+    start = time.perf_counter()
+    for row in rows:
+        db.insert_row(row, "BENCH")
+    results["insert_row"] = n / (time.perf_counter() - start)
+    db.close()
+
+    #naujas budas: stulpelinis buferis
+    db = DBManager(":memory:")
+    db.ensure_schema()
+    db.start_task(category="BENCH")
+    rows = fake_rows(n)
+    start = time.perf_counter()
+    writer = db.writer("BENCH")
+    for row in rows:
+        writer.add(row)
+    writer.flush()
+    results["batch_writer"] = n / (time.perf_counter() - start)
+    db.close()
+
+    for name, rate in results.items():
+        print(f"{name:>14}: {rate:10.0f} rows/s")
+    print(f"{'speedup':>14}: {results['batch_writer'] / results['insert_row']:10.1f}x")
+
+
+#visi issaugoti .html failai is folderio, skelbimo puslapiai turi .main-price
+def load_fixtures(folder):
+    pages = []
+    for path in sorted(Path(folder).rglob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        kind = "listing" if "main-price" in html else "index"
+        pages.append((path, kind, html))
+    return pages
+
+
+#tik greitis, parseriu rezultatu sutapima tikrina aruodas_scrape/fixtures/test_parsers.py
+def bench_parser(folder, repeat):
+    pages = load_fixtures(folder)
+    if len(pages) == 0:
+        print(f"no .html fixtures in {folder}")
+        sys.exit(1)
+
+    for backend in PARSER_BACKENDS:
+        try:
+            h = make_html_ext(backend)
+            h.ext_links("<html></html>")
+        except Exception as err:
+            print(f"{backend:>12}: skipped ({err})")
+            continue
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, kind, html in pages:
+                try:
+                    if kind == "listing":
+                        h.ext_data(html)
+                    else:
+                        h.ext_cards(html)
+                except Exception:
+                    pass
+        rate = len(pages) * repeat / (time.perf_counter() - start)
+        print(f"{backend:>12}: {rate:10.1f} pages/s")
+
+
+#peak RSS megabaitais, linux ru_maxrss duoda KB; vaikai - parse procesai
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+#visas pipeline pries lokalu pakaitala: discovery, fetch, parse, db
+#rate - limiterio greitis (req/s), kad matuotume pipeline, o ne mandaguma tikram aruodui
+def bench_e2e(pages, per_page, fixtures, latency, error_rate, rate, port, parser):
+    site = StandinSite(pages, per_page, fixtures, latency, error_rate)
+    url_head = site.start(port=port)
+
+    with tempfile.TemporaryDirectory() as folder:
+        pipeline = Pipeline(parser=parser, archive=False, http_cache=False, url_head=url_head,
+                            db_path=f"{folder}/bench.db", max_rate=rate)
+        host = urlparse(url_head).netloc
+        pipeline.e.limiters[host] = extractor.RateLimiter(rate, extractor.MAX_CONCURRENCY, max_rate=rate)
+
+        start = time.perf_counter()
+        asyncio.run(pipeline.run())
+        elapsed = time.perf_counter() - start
+
+    listings = sum(run.diagnostics.pages for run in pipeline.runs)
+    own_rss, children_rss = peak_rss_mb()
+    results = {
+        "seconds": elapsed,
+        "requests": site.requests,
+        "pages_per_s": site.requests / elapsed,
+        "listings_per_s": listings / elapsed,
+        "parse_s": sum(run.diagnostics.seconds for run in pipeline.runs),
+        "parse_failures": sum(run.diagnostics.failures for run in pipeline.runs),
+        "db_s": pipeline.db_seconds,
+        "peak_rss_mb": own_rss,
+        "peak_rss_children_mb": children_rss,
+    }
+    print(f"{'statuses':>20}: {dict(sorted(site.statuses.items()))}")
+    return results
+
+
+#kas didesnis - geriau
+HIGHER_IS_BETTER = {"pages_per_s", "listings_per_s"}
+
+
+def print_results(results, baseline=None):
+    for name, value in results.items():
+        line = f"{name:>20}: {value:10.2f}" if isinstance(value, float) else f"{name:>20}: {value:10}"
+        if baseline and baseline.get(name):
+            change = 100 * (value - baseline[name]) / baseline[name]
+            better = change >= 0 if name in HIGHER_IS_BETTER else change <= 0
+            line += f"  ({change:+.1f}% vs baseline{'' if better else ' !'})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bench", choices=["writer", "parser", "e2e"])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--fixtures", default=None, help=f"parser/e2e: folder with saved .html pages (parser default: {PARSER_FIXTURES})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=STANDIN_PAGES, help="e2e: index pages per category before the 302")
+    parser.add_argument("--per-page", type=int, default=STANDIN_PER_PAGE, help="e2e: listings per index page")
+    parser.add_argument("--latency", type=float, default=0.0, help="e2e: seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="e2e: share of 503 responses")
+    parser.add_argument("--rate", type=float, default=50.0, help="e2e: requests/s allowed by the rate limiter")
+    parser.add_argument("--port", type=int, default=STANDIN_PORT)
+    parser.add_argument("--parser", default=DEFAULT_BACKEND, choices=PARSER_BACKENDS)
+    parser.add_argument("--save", help="e2e: write results to this json file")
+    parser.add_argument("--baseline", help="e2e: compare with results saved earlier")
+    args = parser.parse_args()
+
+    if args.bench == "writer":
+        bench_writer(args.rows)
+    elif args.bench == "parser":
+        bench_parser(args.fixtures or PARSER_FIXTURES, args.repeat)
+    elif args.bench == "e2e":
+        results = bench_e2e(args.pages, args.per_page, args.fixtures, args.latency, args.error_rate,
+                            args.rate, args.port, args.parser)
+        baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+        print_results(results, baseline)
+        if args.save:
+            Path(args.save).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
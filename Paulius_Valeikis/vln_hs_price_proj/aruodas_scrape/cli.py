@@ -1,6 +1,13 @@
 import argparse
-from .pipeline_db import run_pipeline
-from .export import export_all, export_latest
+from .pipeline_db import run_pipeline, REFRESH_DAYS, INDEX_TTL_MINUTES, STOP_AFTER_PAGES, FULL_SWEEP_DAYS
+from .html_parse import PARSER_BACKENDS, DEFAULT_BACKEND
+from .export import EXPORT_FORMATS, DEFAULT_FORMAT, export_all, export_incremental, export_latest
+from .archive import reparse
+from .DB_manage import MARKET_METRICS, compact, dedup
+from .stats import STATS_GROUPS, market_stats, format_table, rebuild_stats
+from .shard import run_sharded
+from .workqueue import run_queue
+from .metrics import write_metrics
 
 #CLI irankis visko naudojomuisi //leidzia paliesti scraperi, gauti visus sukauptus rezultatus, gauti paskutinio run rezultatus
 
@@ -8,8 +15,8 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "command",
-        choices=["run", "export"],
-        help="run scraper or export data"
+        choices=["run", "export", "reparse", "compact", "stats", "metrics", "dedup"],
+        help="run scraper, export data, rebuild listings from archived html, compact old snapshots, show market stats, export run metrics or group near-duplicate listings"
     )
     #jei nori tik nauajausu
     parser.add_argument(
@@ -17,19 +24,180 @@ def main():
         action="store_true",
         help="export only latest"
     )
+    #siunciam tik naujus ir pasikeitusius skelbimus
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="run: fetch only new or changed listings; export: append only rows not exported yet"
+    )
+    parser.add_argument(
+        "--refresh-days",
+        type=int,
+        default=REFRESH_DAYS,
+        help="run: refetch unchanged listings older than this many days"
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_BACKENDS,
+        default=DEFAULT_BACKEND,
+        help="run/reparse: html parser backend"
+    )
+    #incrementiniam rezime nebeinam per puslapius kuriuose tik jau matyti skelbimai
+    parser.add_argument(
+        "--stop-after",
+        type=int,
+        default=STOP_AFTER_PAGES,
+        help="run --incremental: stop paging after this many consecutive index pages with no new listings (0 - always page to the end); not supported with --config"
+    )
+    parser.add_argument(
+        "--full-sweep-days",
+        type=int,
+        default=FULL_SWEEP_DAYS,
+        help="run --incremental: page to the end anyway if the last full sweep is this many days old"
+    )
+    #html archyvas reikalingas reparse komandai
+    parser.add_argument(
+        "--no-archive",
+        action="store_true",
+        help="run: do not store fetched html in the archive"
+    )
+    #indekso puslapiu http cache
+    parser.add_argument(
+        "--index-ttl",
+        type=int,
+        default=INDEX_TTL_MINUTES,
+        help="run: reuse index pages fetched within this many minutes without any request"
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="run: always do full GETs of index pages"
+    )
+    #po nutraukto run'o tesiam tik nebaigta darba
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="run: continue the last interrupted run instead of starting over"
+    )
+    #keli crawl procesai, i db raso tik vienas
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="run: crawl categories in this many worker processes feeding one database writer"
+    )
+    #miestai ir kategorijos is konfiguracijos, darbininkai nuomojasi puslapius is work_queue
+    parser.add_argument(
+        "--config",
+        help="run: crawl the cities and categories in this json file through the work queue, e.g. aruodas_scrape/crawl_targets.json"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="run --config: worker processes leasing pages from the queue (default from the config)"
+    )
+    parser.add_argument(
+        "--since",
+        help="reparse/export/stats: first snapshot date, YYYY-MM-DD"
+    )
+    parser.add_argument(
+        "--until",
+        help="reparse/stats: last snapshot date; compact: drop full listings rows up to this date, YYYY-MM-DD"
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default=DEFAULT_FORMAT,
+        help="export: output file format"
+    )
+    #fetch/parse/db metrikos, .json arba prometheus textfile (node_exporter)
+    parser.add_argument(
+        "--metrics-file",
+        help="run/metrics: write per-task metrics here, .json for json, anything else for a prometheus textfile"
+    )
+    #stats: kaip grupuoti ir ka filtruoti
+    parser.add_argument(
+        "--by",
+        choices=list(STATS_GROUPS),
+        default="hood",
+        help="stats: group results by"
+    )
+    parser.add_argument(
+        "--metric",
+        choices=list(MARKET_METRICS),
+        default="price_sqm",
+        help="stats: which value to summarize"
+    )
+    parser.add_argument(
+        "--category",
+        help="stats: only this category, e.g. SELL_FLAT"
+    )
+    parser.add_argument(
+        "--city",
+        help="stats: only this city, e.g. Vilnius"
+    )
+    parser.add_argument(
+        "--hood",
+        help="stats: only this neighbourhood"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="stats: recompute aggregates from listings first"
+    )
     args = parser.parse_args()
 
     if args.command == "run":
         print("PIPELINE WAS STARTED") 
-        run_pipeline()
+        options = dict(incremental=args.incremental, refresh_days=args.refresh_days, parser=args.parser, archive=not args.no_archive,
+            index_ttl=args.index_ttl, http_cache=not args.no_http_cache, stop_after=args.stop_after, full_sweep_days=args.full_sweep_days,
+            metrics_file=args.metrics_file)
+        #run_queue tai atmestu su traceback
+        if args.config and args.incremental and args.stop_after > 0:
+            parser.error("--stop-after is not supported with --config, work queue always pages to the end")
+        if args.config:
+            run_queue(args.config, args.workers, resume=args.resume, **options)
+        elif args.shards > 1:
+            run_sharded(args.shards, resume=args.resume, **options)
+        else:
+            run_pipeline(resume=args.resume, **options)
     #exportuoti galima kartu su --latest
     elif args.command == "export":
         if args.latest:
             print("EXPORTING LATEST")
-            export_latest()
+            export_latest(fmt=args.format)
+        elif args.incremental:
+            print("EXPORTING NEW ROWS")
+            print(f"{export_incremental(fmt=args.format)} new rows")
         else:
             print("EXPORTING ALL")
-            export_all()
+            export_all(fmt=args.format, since=args.since)
+    #perparsina archyvuotus html be jokiu requestu
+    elif args.command == "reparse":
+        print("REPARSING ARCHIVE")
+        reparse(since=args.since, until=args.until, parser=args.parser)
+    #pilnos eilutes lieka tik naujausioms dienoms, senos atkuriamos is listing_snapshots
+    elif args.command == "compact":
+        print("COMPACTING LISTINGS")
+        applied, removed = compact(until=args.until)
+        print(f"{applied} tasks converted to changes, {removed} listings rows removed")
+    #kvantiliai is agregatu lenteliu, be listings skenavimo
+    elif args.command == "stats":
+        if args.rebuild:
+            rebuild_stats()
+        columns, rows = market_stats(by=args.by, metric=args.metric, category=args.category,
+            city=args.city, hood=args.hood, since=args.since, until=args.until)
+        print(format_table(columns, rows))
+    #artimu dublikatu grupes visiems skelbimams (run'as tai daro tik savo skelbimams)
+    elif args.command == "dedup":
+        print("GROUPING NEAR-DUPLICATE LISTINGS")
+        updated, clusters, listings = dedup()
+        print(f"{updated} signatures updated, {listings} listings in {clusters} clusters")
+    #paskutinio run'o (arba nuo --since) tasku metrikos
+    elif args.command == "metrics":
+        path = args.metrics_file or "aruodas.prom"
+        tasks = write_metrics(path, since=args.since)
+        print(f"metrics for {tasks} tasks written to {path}")
 
 
 if __name__ == "__main__":
@@ -1,34 +1,159 @@
-
-import duckdb 
+import duckdb
 import os
+import shutil
+from datetime import date, datetime, timezone
+from pathlib import Path
+from .DB_manage import listings_source_sql
 
 DB = "vilnius.db"
 
-def export_all(listings_csv = "listings_all.csv", tasks_csv = "logs_all.csv", folder = "result_data"):
+#eksportas rasomas tiesiai is duckdb su COPY, niekas nekeliauja per pandas
+EXPORT_FORMATS = ["parquet", "csv"]
+DEFAULT_FORMAT = "parquet"
+#hive stiliaus katalogai: listings/ext_date=2025-11-13/category=SELL_FLAT/data_0.parquet
+PARTITION_COLUMNS = ["ext_date", "category"]
+
+COPY_OPTIONS = {
+    "parquet": "FORMAT PARQUET, COMPRESSION ZSTD",
+    "csv": "FORMAT CSV, HEADER",
+}
+
+
+#query rezultatas i particionuota kataloga
+#overwrite=False perraso tik tuos failus kuriu vardai sutampa su pattern, kiti lieka
+def copy_partitioned(con, query, path, fmt=DEFAULT_FORMAT, overwrite=True, pattern="data_{i}"):
+    mode = "OVERWRITE" if overwrite else "OVERWRITE_OR_IGNORE"
+    con.execute(f"""
+        COPY ({query}) TO '{path}'
+        ({COPY_OPTIONS[fmt]}, PARTITION_BY ({", ".join(PARTITION_COLUMNS)}), {mode}, FILENAME_PATTERN '{pattern}');
+    """)
+
+
+#mazos lenteles (tasks) vienu failu
+def copy_file(con, query, path, fmt=DEFAULT_FORMAT):
+    con.execute(f"COPY ({query}) TO '{path}' ({COPY_OPTIONS[fmt]});")
+
+
+def create_watermark_table(con):
+    with open("aruodas_scrape/SQL/create_export_watermark_table.sql", "r") as f:
+        con.execute(f.read())
+
+
+#eksportuojam tik baigtus taskus: visi task_id mazesni uz pirma dar vykstanti
+#taip vykstancio run'o dalis nepatenka i eksporta ir veliau nedubliuojasi
+def export_bound(con):
+    return con.execute("""
+        SELECT coalesce(min(task_id), (SELECT coalesce(max(task_id), 0) + 1 FROM tasks))
+        FROM tasks
+        WHERE status = 'running';
+    """).fetchone()[0]
+
+
+def watermark(con, sink):
+    row = con.execute("SELECT last_task_id FROM export_watermarks WHERE sink = ?;", [sink]).fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(con, sink, last_task_id, rows):
+    con.execute("""
+        INSERT INTO export_watermarks VALUES (?, ?, ?, ?)
+        ON CONFLICT (sink) DO UPDATE SET
+            last_task_id = excluded.last_task_id,
+            exported_at = excluded.exported_at,
+            rows = excluded.rows;
+    """, [sink, last_task_id, datetime.now(timezone.utc).replace(tzinfo=None), rows])
+
+
+#since - YYYY-MM-DD, tada perrasomos tik particijos nuo tos dienos, senesnes lieka
+#dar neeksportuoti senesniu dienu task'ai pridedami kaip per --incremental, tai watermark galioja abiem
+def export_all(listings_dir = "listings", tasks_file = "logs_all", folder = "result_data", fmt = DEFAULT_FORMAT, since = None):
 
     #jei nera folderio padarom
     os.makedirs(folder, exist_ok=True)
+    sink = f"{folder}/{listings_dir}"
 
     with duckdb.connect(DB) as con:
+        create_watermark_table(con)
+        bound = export_bound(con)
         #listings
-        listings_df = con.sql("SELECT * FROM listings").df()
-        listings_df.to_csv(f"{folder}/{listings_csv}", index=False, encoding="utf-8")
+        #suspaustos dienos is listing_snapshots, kitaip OVERWRITE jas istrintu
+        query = f"SELECT * FROM {listings_source_sql(con)} WHERE task_id < {bound}"
+        if since:
+            since = date.fromisoformat(since)
+            first = watermark(con, sink) + 1
+            append_tasks(con, sink, fmt, first, max(bound - 1, first - 1), f"ext_date < DATE '{since}'")
+            #perrasomos particijos pilnai, kartu ir ju tasks_* failai
+            drop_partitions(sink, since)
+            query += f" AND ext_date >= DATE '{since}'"
+        copy_partitioned(con, query, sink, fmt, overwrite=since is None)
+        #incrementinis tes nuo cia
+        rows = con.execute(f"SELECT count(*) FROM ({query});").fetchone()[0]
+        set_watermark(con, sink, max(bound - 1, watermark(con, sink)) if since else bound - 1, rows)
 
         # logs
-        tasks_df = con.sql("SELECT * FROM tasks").df()
-        tasks_df.to_csv(f"{folder}/{tasks_csv}", index=False, encoding="utf-8")
+        copy_file(con, "SELECT * FROM tasks", f"{folder}/{tasks_file}.{fmt}", fmt)
 
-def export_latest(listings_csv = "listings_latest.csv", tasks_csv = "logs_latest.csv", folder = "result_data"):
+
+#ext_date=YYYY-MM-DD katalogai nuo since
+def drop_partitions(sink, since):
+    for part in Path(sink).glob("ext_date=*"):
+        if date.fromisoformat(part.name.split("=", 1)[1]) >= since:
+            shutil.rmtree(part)
+
+
+#particijos (ext_date, category) kurias palieste task'ai first..last perrasomos pilnai i tasks_<first>_<last>_<i>
+#ta pacia diena pakartotas run'as perkelia jau eksportuotas eilutes i nauja task'a (upsert),
+#tai vien naujo task'o eiluciu pridejimas jas dubliuotu. pakartojus po luzio particijos tiesiog perrasomos
+def append_tasks(con, sink, fmt, first, last, where="true"):
+    source = listings_source_sql(con)
+    parts = con.execute(f"""
+        SELECT DISTINCT ext_date, category FROM {source} WHERE task_id BETWEEN {first} AND {last} AND {where};
+    """).fetchall()
+    if len(parts) == 0:
+        return 0
+    for ext_date, category in parts:
+        shutil.rmtree(Path(sink) / f"ext_date={ext_date}" / f"category={category}", ignore_errors=True)
+
+    con.execute("CREATE OR REPLACE TEMP TABLE export_parts (ext_date DATE, category TEXT);")
+    con.executemany("INSERT INTO export_parts VALUES (?, ?);", parts)
+    query = f"SELECT * FROM {source} WHERE task_id <= {last} AND (ext_date, category) IN (SELECT (ext_date, category) FROM export_parts)"
+    rows = con.execute(f"SELECT count(*) FROM ({query});").fetchone()[0]
+    copy_partitioned(con, query, sink, fmt, overwrite=False, pattern=f"tasks_{first}_{last}_{{i}}")
+    con.execute("DROP TABLE export_parts;")
+    return rows
+
+
+def export_latest(listings_dir = "listings_latest", tasks_file = "logs_latest", folder = "result_data", fmt = DEFAULT_FORMAT):
 
     #jei nera folderio padarom
     os.makedirs(folder, exist_ok=True)
-    
+
     with duckdb.connect(DB) as con:
         #listings
-        listings_df = con.sql("SELECT * FROM listings ls WHERE ls.task_id IN (SELECT ts.task_id FROM tasks ts ORDER BY ts.task_id DESC LIMIT 4) ").df()
-        listings_df.to_csv(f"{folder}/{listings_csv}", index=False, encoding="utf-8")
+        #paskutinis taskas kiekvienai miesto ir kategorijos porai, nepriklausomai nuo ju skaiciaus
+        latest_tasks = "SELECT * FROM tasks QUALIFY row_number() OVER (PARTITION BY city, category ORDER BY task_id DESC) = 1"
+        query = f"SELECT * FROM {listings_source_sql(con)} ls WHERE ls.task_id IN (SELECT ts.task_id FROM ({latest_tasks}) ts)"
+        copy_partitioned(con, query, f"{folder}/{listings_dir}", fmt)
 
         #logs
-        tasks_df = con.sql("SELECT * FROM tasks ORDER BY task_id DESC LIMIT 4").df()
-        tasks_df.to_csv(f"{folder}/{tasks_csv}", index=False, encoding="utf-8")
+        copy_file(con, latest_tasks + " ORDER BY task_id", f"{folder}/{tasks_file}.{fmt}", fmt)
+
+
+#perraso tik particijas kurias palieste dar neeksportuoti i sita kataloga (sink) task'ai
+def export_incremental(listings_dir = "listings", tasks_file = "logs_all", folder = "result_data", fmt = DEFAULT_FORMAT):
+
+    #jei nera folderio padarom
+    os.makedirs(folder, exist_ok=True)
+    sink = f"{folder}/{listings_dir}"
+
+    with duckdb.connect(DB) as con:
+        create_watermark_table(con)
+        first = watermark(con, sink) + 1
+        last = max(export_bound(con) - 1, first - 1)
+
+        rows = append_tasks(con, sink, fmt, first, last)
+        set_watermark(con, sink, last, rows)
 
+        #logs mazi, visada pilnai
+        copy_file(con, "SELECT * FROM tasks", f"{folder}/{tasks_file}.{fmt}", fmt)
+        return rows
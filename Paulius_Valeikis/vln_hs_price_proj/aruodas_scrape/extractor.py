@@ -1,14 +1,244 @@
 import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlparse
 from rnet import Impersonate, Client, BlockingClient
-from tenacity import retry, stop_after_attempt
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from logger import logger
 
+#requestai per sekunde vienam hostui: pradzia, minimumas ir maksimumas
+START_RATE = 2.0
+MIN_RATE = 0.2
+MAX_RATE = 10.0
+#kiek requestu vienu metu vienam hostui
+START_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+#jei atsakymas greitesnis uz tiek sekundziu, galima spausti daugiau
+FAST_LATENCY = 1.0
+RATE_STEP = 0.1
+#po 429/5xx/302 audros greitis dalinamas ir darom pauze, kuri kaskart dvigubeja
+RATE_CUT = 0.5
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 120.0
+#302 audra: tiek paskutiniu atsakymu ir kokia dalis ju 302
+STATUS_WINDOW = 20
+REDIRECT_STORM = 0.5
+#pakartojimai: kiek bandymu ir atsitiktine eksponentine pauze tarp ju (sekundemis)
+RETRY_ATTEMPTS = 3
+RETRY_WAIT = 1.0
+RETRY_MAX_WAIT = 30.0
+#sitie statusai laikini, juos verta bandyti dar karta
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+#http cache katalogas (vienas json failas vienam url)
+CACHE_DIR = "http_cache"
 
 
+#vieno requesto rezultatas, klaidos atveju body None o error uzpildytas
+#galima isskleisti kaip anksciau: html, status = await e.fetch(url)
+class FetchResult:
+    def __init__(self, url, status=None, body=None, latency=0.0, attempts=0, error=None):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.latency = latency
+        self.attempts = attempts
+        self.error = error
+        #validatoriai is atsakymo headeriu
+        self.etag = None
+        self.last_modified = None
+        #None - is tinklo, "fresh" - is cache be requesto, "revalidated" - serveris atsake 304
+        self.cache = None
+        #kiekvieno bandymo statusas (None - tinklo klaida) ir trukme, metrikoms
+        self.statuses = []
+        self.latencies = []
+        #kiek baitu atsiusta per visus bandymus
+        self.bytes = 0
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+    def __iter__(self):
+        return iter((self.body, self.status))
+
+    def __repr__(self):
+        return f"FetchResult({self.url!r}, status={self.status}, attempts={self.attempts}, error={self.error!r}, cache={self.cache})"
+
+
+#ETag/Last-Modified ir body diske, kad butu galima siusti salyginius requestus ir priimti 304
+#saugoma tik kai serveris duoda validatoriu arba kai naudojamas ttl
+class HttpCache:
+    def __init__(self, folder=CACHE_DIR):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.lookups = 0
+        #grazinta be requesto (ttl)
+        self.fresh = 0
+        #serveris atsake 304
+        self.revalidated = 0
+        #pilnas atsakymas
+        self.misses = 0
+
+    def path(self, url):
+        return self.folder / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def lookup(self, url):
+        self.lookups += 1
+        try:
+            with open(self.path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    #salyginio requesto headeriai
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, body, etag=None, last_modified=None):
+        entry = {"url": url, "etag": etag, "last_modified": last_modified, "fetched": time.time(), "body": body}
+        self.write(url, entry)
+        return entry
+
+    #po 304 body tas pats, tik atnaujinam kada tikrinta
+    def touch(self, url, entry):
+        entry["fetched"] = time.time()
+        self.write(url, entry)
+
+    def write(self, url, entry):
+        path = self.path(url)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def hit_ratio(self):
+        return (self.fresh + self.revalidated) / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "fresh": self.fresh,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio(), 3),
+        }
+
+
+#serveris atsake laikina klaida, tenacity bandys dar karta
+class RetryableStatus(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+#token bucket vienam hostui, greitis ir lygiagretumas prisitaiko prie serverio atsaku
+#share - kokia bendro hosto biudzeto dalis tenka sitam procesui (kai crawl'ina keli shard'ai)
+#max_rate - greicio lubos visam hostui, benchmarkas pries lokalu pakaitala leidzia daugiau
+class RateLimiter:
+    def __init__(self, rate=START_RATE, concurrency=START_CONCURRENCY, share=1.0, max_rate=MAX_RATE):
+        self.min_rate = MIN_RATE * share
+        self.max_rate = max_rate * share
+        self.max_concurrency = max(1, round(MAX_CONCURRENCY * share))
+        self.rate = rate * share
+        self.limit = max(1, min(self.max_concurrency, round(concurrency * share)))
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.active = 0
+        #kiek korutinu laukia leidimo
+        self.waiting = 0
+        self.paused_until = 0.0
+        #paskutinio sumazinimo laikas, senesni requestai jo nebekartoja
+        self.last_cut = 0.0
+        self.backoff = BASE_BACKOFF
+        self.recent = deque(maxlen=STATUS_WINDOW)
+        self.fast_streak = 0
+
+    @property
+    def queue_depth(self):
+        return self.waiting
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 2),
+            "concurrency": self.limit,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+        }
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0 and self.active < self.limit:
+                    self.tokens -= 1.0
+                    self.active += 1
+                    return
+                await asyncio.sleep(max((1.0 - self.tokens) / self.rate, 0.05))
+        finally:
+            self.waiting -= 1
+
+    #status None - tinklo klaida, started - kada requestas issiustas
+    #lygiagretus requestai uz ta pati perkrovos epizoda mazina greiti tik viena karta:
+    #klaidos requestu issiustu pries paskutini sumazinima jau yra ivertintos
+    def release(self, status, latency, started):
+        self.active -= 1
+        self.recent.append(status)
+
+        if status is None or status == 429 or status >= 500 or self.redirect_storm():
+            self.fast_streak = 0
+            if started < self.last_cut:
+                return
+            self.last_cut = time.monotonic()
+            self.rate = max(self.min_rate, self.rate * RATE_CUT)
+            self.limit = max(1, self.limit // 2)
+            self.paused_until = time.monotonic() + self.backoff
+            logger.warning(f"backing off {self.backoff:.0f}s after status {status}, rate now {self.rate:.2f}/s")
+            self.backoff = min(MAX_BACKOFF, self.backoff * 2)
+            self.recent.clear()
+        elif latency < FAST_LATENCY:
+            self.rate = min(self.max_rate, self.rate + RATE_STEP)
+            self.backoff = BASE_BACKOFF
+            #lygiagretuma didinam tik po tiek greitu atsakymu kiek dabar leidziama vienu metu
+            self.fast_streak += 1
+            if self.fast_streak >= self.limit:
+                self.limit = min(self.max_concurrency, self.limit + 1)
+                self.fast_streak = 0
+        else:
+            self.fast_streak = 0
+
+    #vienas 302 yra normali paskutinio puslapio zyme, bet daug is eiles reiskia kad esam blokuojami
+    def redirect_storm(self):
+        if len(self.recent) < STATUS_WINDOW:
+            return False
+        return sum(1 for status in self.recent if status == 302) >= REDIRECT_STORM * STATUS_WINDOW
+
 
 class Extractor: 
     #kad inicializuojant objekta buti aktyvi ta pati sesija ir enreiktu passinti per funkcijas
-    def __init__(self) -> None:
+    #cache - HttpCache, naudojamas tik fetch(..., cached=True)
+    #rate_share - limiteriu biudzeto dalis, kai tas pats hostas dalinamas keliems procesams
+    def __init__(self, cache=None, rate_share=1.0, max_rate=MAX_RATE) -> None:
+        self.cache = cache
+        self.rate_share = rate_share
+        self.max_rate = max_rate
         self.session = Client()
         self.session.update(
             impersonate=Impersonate.Firefox139
@@ -18,32 +248,103 @@ class Extractor:
         self.blocking.update(
             impersonate=Impersonate.Firefox139
         )
-    @retry(stop=stop_after_attempt(3))
-    async def fetch(self, url):
-        logger.info(f"requasting url: {url}")
-        
-        resp = await self.session.get(url)
-        #print("status:", resp.status)
-        # print("final_url:", str(resp.url))
-        
-        html = await resp.text()
-
-        # print("len(html):", len(html))
-        # print(html[:400])  # look 
-        return html, resp.status
-    
-    async def fetch_all(self, urls, conc):
-        #limituoja requestu skaiciu vienu metu
+        #kiekvienam hostui atskiras limiteris
+        self.limiters = {}
+
+    def limiter(self, url):
+        host = urlparse(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = RateLimiter(share=self.rate_share, max_rate=self.max_rate)
+        return self.limiters[host]
+
+    #dabartinis greitis ir eile kiekvienam hostui
+    def limiter_stats(self):
+        return {host: limiter.stats() for host, limiter in self.limiters.items()}
+
+    #vienas bandymas, 429/5xx virsta RetryableStatus
+    async def fetch_once(self, result, headers=None):
+        limiter = self.limiter(result.url)
+        await limiter.acquire()
+        logger.info(f"requasting url: {result.url}")
+
+        start = time.monotonic()
+        result.status = None
+        result.body = None
+        try:
+            resp = await self.session.get(result.url, headers=headers or {})
+            result.status = resp.status
+            result.etag = header_text(resp.headers.get("etag"))
+            result.last_modified = header_text(resp.headers.get("last-modified"))
+            #baitai skaitomi kaip atejo, o ne is naujo uzkoduoto teksto
+            content = await resp.bytes()
+            result.bytes += len(content)
+            result.body = content.decode(resp.encoding or "utf-8", errors="replace")
+        finally:
+            result.latency = time.monotonic() - start
+            result.statuses.append(result.status)
+            result.latencies.append(result.latency)
+            limiter.release(result.status, result.latency, start)
+
+        if result.status in RETRY_STATUSES:
+            raise RetryableStatus(result.status)
+
+    #niekada nemeta isimties, nepavykes requestas grazinamas su error
+    #cached=True - salyginis requestas per HttpCache, ttl (sekundemis) - jei tikrinta neseniai, requesto visai nera
+    async def fetch(self, url, cached=False, ttl=None):
+        result = FetchResult(url)
+        entry = None
+        if cached and self.cache is not None:
+            entry = self.cache.lookup(url)
+            if entry is not None and ttl and time.time() - entry["fetched"] < ttl:
+                self.cache.fresh += 1
+                result.status, result.body, result.cache = 200, entry["body"], "fresh"
+                return result
+            headers = self.cache.conditional_headers(entry)
+        else:
+            headers = {}
+
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(RETRY_ATTEMPTS),
+            wait=wait_random_exponential(multiplier=RETRY_WAIT, max=RETRY_MAX_WAIT),
+            retry=retry_if_exception_type(Exception),
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    result.attempts = attempt.retry_state.attempt_number
+                    await self.fetch_once(result, headers)
+        except Exception as err:
+            result.error = str(err) or type(err).__name__
+            result.body = None
+            logger.info(f"giving up on {url} after {result.attempts} attempts: {result.error}")
+            return result
+
+        if cached and self.cache is not None:
+            self.update_cache(result, entry, ttl)
+        return result
+
+    #304 pavercia i iprasta 200 su body is cache, nauja 200 issaugo
+    def update_cache(self, result, entry, ttl):
+        if result.status == 304 and entry is not None:
+            self.cache.revalidated += 1
+            self.cache.touch(result.url, entry)
+            result.status, result.body, result.cache = 200, entry["body"], "revalidated"
+        elif result.status == 200:
+            self.cache.misses += 1
+            if result.etag or result.last_modified or ttl:
+                self.cache.store(result.url, result.body, result.etag, result.last_modified)
+
+    async def fetch_all(self, urls, conc=MAX_CONCURRENCY):
+        #limituoja requestu skaiciu vienu metu, greiti reguliuoja limiteris
         sem = asyncio.Semaphore(conc) 
         async def safe_fetch(url):
             async with sem:
-                
-                #eat status code her meibe
                 return await self.fetch(url)
 
+        #fetch klaidu nemeta, tai kiekvienam url grizta FetchResult
         tasks = [safe_fetch(url) for url in urls]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        return  results
+        return await asyncio.gather(*tasks)
     
     def blocking_fetch(self, url):
         logger.info(f"requasting url: {url}")
@@ -51,6 +352,13 @@ class Extractor:
         return resp.text()
     
 
+#rnet headeriu reiksmes yra bytes
+def header_text(value):
+    if value is None:
+        return None
+    return value.decode("latin-1") if isinstance(value, bytes) else str(value)
+
+
 # async def main():
 
 #     e = Extractor()
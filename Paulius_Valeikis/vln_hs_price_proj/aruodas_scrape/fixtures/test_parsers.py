@@ -0,0 +1,47 @@
+from pathlib import Path
+import pytest
+from aruodas_scrape.html_parse import PARSER_BACKENDS, DEFAULT_BACKEND, card_hash, make_html_ext
+
+#aruodas puslapiu pavyzdziai salia sito failo, leisti is projekto root: poetry run pytest
+FIXTURES = Path(__file__).parent
+PAGES = sorted(FIXTURES.glob("*.html"))
+INDEX_PAGES = [path for path in PAGES if "main-price" not in path.read_text(encoding="utf-8")]
+
+
+#lxml ir selectolax nebutini, neidiegus testai praleidziami
+def html_ext(backend):
+    try:
+        h = make_html_ext(backend)
+        h.ext_links("<html></html>")
+    except Exception as err:
+        pytest.skip(f"{backend} not installed ({err})")
+    return h
+
+
+#kortele be teksto arba dvi vienodos korteles - incremental nepastebes kainos pokycio
+@pytest.mark.parametrize("backend", PARSER_BACKENDS)
+@pytest.mark.parametrize("path", INDEX_PAGES, ids=lambda path: path.name)
+def test_card_hashes_not_empty_and_unique(backend, path):
+    cards = html_ext(backend).ext_cards(path.read_text(encoding="utf-8"))
+    hashes = [h for _, _, h in cards]
+    assert len(cards) > 0
+    assert card_hash("") not in hashes
+    assert len(set(hashes)) == len(hashes)
+
+
+#klaida irgi rezultatas - ji turi buti ta pati visuose parseriuose
+def parse_page(h, html):
+    try:
+        if "main-price" in html:
+            return h.ext_data(html)
+        return [h.ext_links(html), h.ext_cards(html)]
+    except Exception as err:
+        return f"error: {type(err).__name__}"
+
+
+#greitesni parseriai turi duoti identiskus SCHEMA zodynus, nuorodas ir korteles kaip numatytasis
+@pytest.mark.parametrize("backend", [backend for backend in PARSER_BACKENDS if backend != DEFAULT_BACKEND])
+@pytest.mark.parametrize("path", PAGES, ids=lambda path: path.name)
+def test_backend_matches_default(backend, path):
+    html = path.read_text(encoding="utf-8")
+    assert parse_page(html_ext(backend), html) == parse_page(make_html_ext(DEFAULT_BACKEND), html)
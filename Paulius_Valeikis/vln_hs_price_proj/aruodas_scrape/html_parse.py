@@ -1,7 +1,18 @@
 
+import hashlib
+import re
+import time
+from collections import Counter
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 
+#parserio variantai: bs4 su html.parser arba lxml, arba selectolax (lexbor)
+#lxml ir selectolax nebutini, idiegti atskirai: poetry run pip install lxml selectolax
+PARSER_BACKENDS = ["html.parser", "lxml", "selectolax"]
+DEFAULT_BACKEND = "html.parser"
+#indekso puslapio skelbimo nuorodos klase
+CARD_LINK_CLASS = "object-image-link-big_thumbs"
+
 MULTI_VALUE_FIELDS = [
     "peculiars",
     "extra_spaces",
@@ -50,28 +61,113 @@ LT_EN_DICT = {
     }
 
 
-def translate_label(label, mapping):
+#skelbimo kodas nuorodos gale, pvz. ".../butu-nuoma-vilniuje-...-4-1432650/" -> "4-1432650"
+LISTING_CODE_RE = re.compile(r"(\d+-\d+)/?$")
+
+
+def listing_code(href):
+    match = LISTING_CODE_RE.search(urlparse(href).path)
+    return match.group(1) if match else None
+
+
+#nezinomi labeliai surenkami i unknown sarasa (jei duotas), ne i faila kiekvienam puslapiui
+def translate_label(label, mapping, unknown=None):
     label = label.strip()
     if label in mapping:
         return mapping[label]
     else:
-        with open("labels.txt", 'a') as f:
-            f.write(f"No English key for label: {label}\n")
+        if unknown is not None:
+            unknown.append(label)
         return None
+
+
+#vieno task'o parsinimo statistika atmintyje, i db irasoma viena karta task'o gale
+#visos reiksmes sumuojamos, tai pratesus run'a (--resume) jos pridedamos prie esamu
+class ParseDiagnostics:
+    def __init__(self):
+        self.pages = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        #kiek puslapiu turejo ne tuscia lauka
+        self.filled = Counter()
+        self.unknown_labels = Counter()
+
+    def add(self, row, seconds, unknown_labels=(), error=None):
+        self.pages += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.unknown_labels.update(unknown_labels)
+        if error is not None or row is None:
+            self.failures += 1
+            return
+        self.filled.update(field for field, value in row.items() if value not in (None, ""))
+
+    #(kind, name, value) eilutes parse_stats lentelei
+    def rows(self):
+        rows = [
+            ("page", "pages", self.pages),
+            ("page", "failures", self.failures),
+            ("page", "seconds", self.seconds),
+            ("page", "max_seconds", self.max_seconds),
+        ]
+        rows += [("filled", field, self.filled[field]) for field in SCHEMA if field in self.filled]
+        rows += [("unknown_label", label, count) for label, count in self.unknown_labels.items()]
+        return rows
+
+    def summary(self):
+        mean_ms = 1000 * self.seconds / self.pages if self.pages else 0.0
+        unknown = ", ".join(f"{label} ({count})" for label, count in self.unknown_labels.most_common(5))
+        return f"{self.pages} pages, {self.failures} failed, {mean_ms:.1f} ms/page, unknown labels: {unknown or '-'}"
+
+
+#headeris "Vilnius, Antakalnis, Sapiegos g." -> city, hood, street
+def fill_location(listing, header):
+    location = [x.strip() for x in header.split(",")]
+    #reikia sita sutvarkyti yra listingu kur nera rajono bet yra gatve kuri visada paskutine
+    if len(location) == 3:
+        listing["city"] = location[0]
+        listing["hood"] = location[1]
+        listing["street"] = location[2]
+    elif len(location) == 2:
+        listing["city"] = location[0]
+        listing["street"] = location[1]
+
+
+#ar elemente yra kito skelbimo nuoroda, galerijoje gali buti kelios to paties skelbimo nuorodos
+def other_listing(links, path):
+    return any(urlparse(link).path != path for link in links)
+
+
+def card_hash(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+#parenka parseri pagal pavadinima
+def make_html_ext(backend=DEFAULT_BACKEND):
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"unknown parser backend {backend}, choose from {PARSER_BACKENDS}")
+    if backend == "selectolax":
+        return SelectolaxExt()
+    return Html_ext(parser=backend)
+
     
 class Html_ext:
-    def __init__(self):
+    def __init__(self, parser=DEFAULT_BACKEND):
         self.mvf = MULTI_VALUE_FIELDS
         self.schema = SCHEMA
         self.lten = LT_EN_DICT
+        #paskutinio ext_data puslapio nezinomi labeliai
+        self.unknown_labels = []
+        self.parser = parser
     #is puslapio istraukia visu nuosavybiu nuorodas
     def ext_links(self, html):
         links = []
         seen = set()
 
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, self.parser)
 
-        anchors = soup.find_all("a", class_="object-image-link-big_thumbs")
+        anchors = soup.find_all("a", class_=CARD_LINK_CLASS)
         for a in anchors:
             link = a.get("href")
             parsed = urlparse(link)
@@ -83,6 +179,37 @@ class Html_ext:
                 links.append(a.get("href"))
         return links
     
+    #kaip ext_links, bet dar grazina korteles teksto hash
+    #jei kaina ar kiti korteles duomenys pasikeite, hash bus kitas
+    def ext_cards(self, html):
+        cards = []
+        seen = set()
+
+        soup = BeautifulSoup(html, self.parser)
+
+        anchors = soup.find_all("a", class_=CARD_LINK_CLASS)
+        for a in anchors:
+            link = a.get("href")
+            unique_key = urlparse(link).path
+            if unique_key in seen:
+                continue
+            seen.add(unique_key)
+
+            #lipam aukstyn iki elemento kuriame yra kaina, tai ir yra kortele
+            #bet ne auksciau nei prasideda kitos korteles (kito skelbimo nuoroda)
+            card = a.parent
+            for parent in a.parents:
+                if parent.name == "body" or other_listing(
+                    (x.get("href") for x in parent.find_all("a", class_=CARD_LINK_CLASS)), unique_key
+                ):
+                    break
+                card = parent
+                if "€" in parent.get_text():
+                    break
+            text = card.get_text(" ", strip=True)
+            cards.append((listing_code(link), link, card_hash(text)))
+        return cards
+
     def ext_data_old(self, html):
     #tuscia skelbimo struktura
         listing = {k: None for k in self.schema}
@@ -123,8 +250,9 @@ class Html_ext:
     def ext_data(self, html):
     #tuscia skelbimo struktura
         listing = {k: None for k in self.schema}
+        self.unknown_labels = []
 
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, self.parser)
         #istraukiama pagrindine informacija
         
         basic_info =  soup.select("div.advert-heading-col.title-col h1")
@@ -140,22 +268,13 @@ class Html_ext:
         listing["price"] = price
         if basic_info:
             header = basic_info.get_text(strip=True)
-            location = [x.strip() for x in header.split(",")]
-            #print(f"{location} gauta info")
-            #reikia sita sutvarkyti yra listingu kur nera rajono bet yra gatve kuri visada paskutine
-            if len(location) == 3:
-                listing["city"] = location[0]
-                listing["hood"] = location[1]
-                listing["street"] = location[2]
-            elif len(location) == 2:
-                listing["city"] = location[0]
-                listing["street"] = location[1]
+            fill_location(listing, header)
 
 
         extra_info = soup.select("dl > dt")
         for dt in extra_info:
             label = dt.get_text(strip=True)
-            label = translate_label(label, self.lten)
+            label = translate_label(label, self.lten, self.unknown_labels)
             if label is None:      # ⬅ skip unknown fields safely
                 continue
             dd = dt.find_next_sibling("dd")
@@ -169,6 +288,118 @@ class Html_ext:
     
 
 
+#kaip bs4 get_text(" ", strip=True): selectolax tarpus tarp zymu palieka tusciais tekstais, jie praleidziami
+def node_text(node):
+    return " ".join(part for part in node.text(separator="\x00", strip=True).split("\x00") if part)
+
+
+#tas pats kas Html_ext tik per selectolax, rezultatai turi sutapti baitas i baita
+#patikrinti: python -m aruodas_scrape.bench parser --fixtures <html folderis>
+class SelectolaxExt(Html_ext):
+    def __init__(self):
+        super().__init__(parser="selectolax")
+        from selectolax.lexbor import LexborHTMLParser
+        self.html_parser = LexborHTMLParser
+
+    def ext_links(self, html):
+        links = []
+        seen = set()
+
+        tree = self.html_parser(html)
+        for a in tree.css(f"a.{CARD_LINK_CLASS}"):
+            link = a.attributes.get("href")
+            unique_key = urlparse(link).path
+            if unique_key not in seen:
+                seen.add(unique_key)
+                links.append(link)
+        return links
+
+    def ext_cards(self, html):
+        cards = []
+        seen = set()
+
+        tree = self.html_parser(html)
+        for a in tree.css(f"a.{CARD_LINK_CLASS}"):
+            link = a.attributes.get("href")
+            unique_key = urlparse(link).path
+            if unique_key in seen:
+                continue
+            seen.add(unique_key)
+
+            card = a.parent
+            parent = a.parent
+            while parent is not None and parent.tag not in ("body", "html", "-document"):
+                if other_listing((x.attributes.get("href") for x in parent.css(f"a.{CARD_LINK_CLASS}")), unique_key):
+                    break
+                card = parent
+                if "€" in parent.text():
+                    break
+                parent = parent.parent
+            cards.append((listing_code(link), link, card_hash(node_text(card))))
+        return cards
+
+    def ext_data(self, html):
+        listing = {k: None for k in self.schema}
+        self.unknown_labels = []
+
+        tree = self.html_parser(html)
+        basic_info = tree.css("div.advert-heading-col.title-col h1")
+        #Yra pirmas reklaminis headeris coliving erdvem ir visokiem grupiniam pastatams
+        if len(basic_info) > 1:
+            basic_info = basic_info[1]
+        else:
+            basic_info = basic_info[0]
+
+        listing["price"] = tree.css_first(".main-price").text(strip=True)
+        fill_location(listing, basic_info.text(strip=True))
+
+        for dt in tree.css("dl > dt"):
+            label = translate_label(dt.text(strip=True), self.lten, self.unknown_labels)
+            if label is None:
+                continue
+            dd = dt.next
+            while dd is not None and dd.tag != "dd":
+                dd = dd.next
+            if label in self.mvf:
+                value = ";".join(span.text(strip=True) for span in dd.css("span"))
+            else:
+                value = dd.text(strip=True)
+            listing[label] = value
+        return listing
+
+
+#funkcijos parsinimui atskiruose procesuose (ProcessPoolExecutor), metodu per pickle neperduosi
+#kiekvienas procesas pasilaiko savo parseri
+_html_exts = {}
+
+
+def _html_ext(backend):
+    if backend not in _html_exts:
+        _html_exts[backend] = make_html_ext(backend)
+    return _html_exts[backend]
+
+
+def parse_listing(html, backend=DEFAULT_BACKEND):
+    return _html_ext(backend).ext_data(html)
+
+
+#kaip parse_listing, bet grazina ir diagnostika: (row, seconds, unknown_labels, error)
+def parse_listing_diag(html, backend=DEFAULT_BACKEND):
+    ext = _html_ext(backend)
+    start = time.perf_counter()
+    try:
+        row = ext.ext_data(html)
+        error = None
+    except Exception as err:
+        row = None
+        error = str(err) or type(err).__name__
+    return row, time.perf_counter() - start, ext.unknown_labels, error
+
+
+def parse_cards(html, backend=DEFAULT_BACKEND):
+    return _html_ext(backend).ext_cards(html)
+
+
 # def main():
 #     h = Html_ext()
 
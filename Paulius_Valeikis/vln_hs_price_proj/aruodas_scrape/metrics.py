@@ -0,0 +1,236 @@
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+import duckdb
+
+DB = "vilnius.db"
+
+#fetch trukmes histogramos ribos sekundemis (prometheus "le"), virs paskutines - +Inf
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+METRICS_FORMATS = ["prom", "json"]
+PREFIX = "aruodas"
+
+#(kind, name) task_metrics/parse_stats lentelese -> (metrika, tipas, aprasymas)
+#name None - name tampa labeliu (label)
+PROM_METRICS = [
+    ("fetch", "bytes", "fetch_bytes_total", "counter", "Bytes downloaded."),
+    ("fetch", "retries", "fetch_retries_total", "counter", "Extra attempts after a failed or retryable response."),
+    ("fetch", "failed", "fetch_failures_total", "counter", "Fetches that failed after all attempts."),
+    ("status", None, "http_responses_total", "counter", "Responses by status code, error - no response.", "status"),
+    ("cache", None, "http_cache_total", "counter", "Index pages served from the http cache.", "result"),
+    ("db_seconds", None, "db_seconds_total", "counter", "Time spent in database calls by step.", "step"),
+    ("db_calls", None, "db_calls_total", "counter", "Database calls by step.", "step"),
+    ("parse", "pages", "parse_pages_total", "counter", "Listing pages parsed."),
+    ("parse", "failures", "parse_failures_total", "counter", "Listing pages that failed to parse."),
+    ("parse", "seconds", "parse_seconds_total", "counter", "Time spent parsing listing pages."),
+    ("parse", "max_seconds", "parse_max_seconds", "gauge", "Slowest listing page parse."),
+    ("cast_failure", None, "cast_failures_total", "counter", "Non-empty values that finalize could not convert to a number or date.", "field"),
+]
+TASK_GAUGES = [
+    ("seconds", "task_duration_seconds", "Longest task wall time."),
+    ("pages", "task_index_pages", "Index pages crawled."),
+    ("records", "task_records", "Listings stored."),
+]
+
+
+#histogramos bucket'o riba kuriai priklauso trukme
+def bucket_label(seconds):
+    for le in LATENCY_BUCKETS:
+        if seconds <= le:
+            return str(le)
+    return "+Inf"
+
+
+#vienos kategorijos (task'o) skaitikliai, kaip ParseDiagnostics tik fetch ir db etapams
+class TaskMetrics:
+    def __init__(self):
+        self.latency = Counter()
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.failed = 0
+        self.statuses = Counter()
+        self.cache = Counter()
+        self.db_seconds = Counter()
+        self.db_calls = Counter()
+
+    #FetchResult, kiekvienas bandymas skaitomas atskirai
+    #final=False - klaida dar bus bandoma is naujo (dead letter), failed nedidinam
+    def fetch(self, result, final=True):
+        for status, latency in zip(result.statuses, result.latencies):
+            self.latency[bucket_label(latency)] += 1
+            self.latency_sum += latency
+            self.requests += 1
+            self.statuses["error" if status is None else str(status)] += 1
+        self.retries += max(0, len(result.statuses) - 1)
+        self.bytes += result.bytes
+        if result.error is not None and final:
+            self.failed += 1
+        if result.cache is not None:
+            self.cache[result.cache] += 1
+
+    def db(self, step, seconds, calls=1):
+        self.db_seconds[step] += seconds
+        self.db_calls[step] += calls
+
+    @contextmanager
+    def timed(self, step):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.db(step, time.perf_counter() - started)
+
+    #(kind, name, value) eilutes task_metrics lentelei
+    def rows(self):
+        rows = [
+            ("fetch", "requests", self.requests),
+            ("fetch", "latency_sum", self.latency_sum),
+            ("fetch", "bytes", self.bytes),
+            ("fetch", "retries", self.retries),
+            ("fetch", "failed", self.failed),
+        ]
+        rows += [("latency_bucket", le, n) for le, n in self.latency.items()]
+        rows += [("status", status, n) for status, n in self.statuses.items()]
+        rows += [("cache", name, n) for name, n in self.cache.items()]
+        rows += [("db_seconds", step, seconds) for step, seconds in self.db_seconds.items()]
+        rows += [("db_calls", step, n) for step, n in self.db_calls.items()]
+        return rows
+
+    def summary(self):
+        mean_ms = 1000 * self.latency_sum / self.requests if self.requests else 0.0
+        db = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in self.db_seconds.most_common())
+        return (f"{self.requests} requests, {mean_ms:.0f} ms mean, {self.bytes / 1e6:.1f} MB, "
+                f"{self.retries} retries, {self.failed} failed, db: {db or '-'}")
+
+
+#taskai ir ju metrikos: [(task_id, category, run_date, status, {gauges}, {(kind, name): value})]
+#task_ids None - paskutinio run'o (arba visi nuo since) taskai
+def load_metrics(task_ids=None, since=None, db_path=DB):
+    with duckdb.connect(db_path, read_only=True) as con:
+        if task_ids is not None:
+            where, params = "list_contains(?, task_id)", [list(task_ids)]
+        elif since is not None:
+            where, params = "run_date >= CAST(? AS DATE)", [since]
+        else:
+            where, params = "run_date = (SELECT max(run_date) FROM tasks)", []
+
+        tasks = con.execute(f"""
+            SELECT task_id, category, run_date, status,
+                epoch(end_time - start_time) AS seconds, pages, records
+            FROM tasks
+            WHERE {where}
+            ORDER BY task_id;
+        """, params).fetchall()
+        ids = [task[0] for task in tasks]
+        values = con.execute("""
+            SELECT task_id, kind, name, value FROM task_metrics WHERE list_contains(?, task_id)
+            UNION ALL
+            SELECT task_id, CASE WHEN kind = 'page' THEN 'parse' ELSE kind END, name, value
+            FROM parse_stats
+            WHERE kind IN ('page', 'cast_failure') AND list_contains(?, task_id);
+        """, [ids, ids]).fetchall()
+
+    by_task = {}
+    for task_id, kind, name, value in values:
+        by_task.setdefault(task_id, {})[(kind, name)] = value
+    return [
+        (task_id, category, run_date, status, {"seconds": seconds, "pages": pages, "records": records}, by_task.get(task_id, {}))
+        for task_id, category, run_date, status, seconds, pages, records in tasks
+    ]
+
+
+def prom_line(metric, labels, value):
+    text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return f"{PREFIX}_{metric}{{{text}}} {0 if value is None else value}"
+
+
+#vienos kategorijos taskai sujungiami: skaitikliai sumuojami, max_seconds ir trukme - didziausia
+def category_totals(tasks):
+    totals = {}
+    for task_id, category, run_date, status, gauges, values in tasks:
+        merged_gauges, merged, statuses = totals.setdefault(category, ({}, {}, Counter()))
+        statuses[status] += 1
+        for name, value in gauges.items():
+            merged_gauges[name] = merge_value(merged_gauges.get(name), value, name == "seconds")
+        for key, value in values.items():
+            merged[key] = merge_value(merged.get(key), value, key == ("parse", "max_seconds"))
+    return totals
+
+
+def merge_value(old, new, use_max):
+    if old is None or new is None:
+        return new if old is None else old
+    return max(old, new) if use_max else old + new
+
+
+#node_exporter textfile formatas
+#labeliai tik category (ir pan.), task_id ir run_date kiekviena run'a kurtu naujas serijas - jie tik json'e
+def prometheus_text(tasks):
+    totals = category_totals(tasks)
+    lines = []
+
+    metric = "fetch_latency_seconds"
+    lines += [f"# HELP {PREFIX}_{metric} Fetch latency per attempt.", f"# TYPE {PREFIX}_{metric} histogram"]
+    for category, (gauges, values, statuses) in totals.items():
+        labels = {"category": category}
+        cumulative = 0
+        for le in [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]:
+            cumulative += values.get(("latency_bucket", le), 0)
+            lines.append(prom_line(f"{metric}_bucket", {**labels, "le": le}, int(cumulative)))
+        lines.append(prom_line(f"{metric}_sum", labels, values.get(("fetch", "latency_sum"), 0)))
+        lines.append(prom_line(f"{metric}_count", labels, int(values.get(("fetch", "requests"), 0))))
+
+    for kind, name, metric, kind_type, help_text, *label in PROM_METRICS:
+        lines += [f"# HELP {PREFIX}_{metric} {help_text}", f"# TYPE {PREFIX}_{metric} {kind_type}"]
+        for category, (gauges, values, statuses) in totals.items():
+            labels = {"category": category}
+            for (value_kind, value_name), value in sorted(values.items()):
+                if value_kind != kind or (name is not None and value_name != name):
+                    continue
+                extra = {label[0]: value_name} if label else {}
+                lines.append(prom_line(metric, {**labels, **extra}, value))
+
+    for name, metric, help_text in TASK_GAUGES:
+        lines += [f"# HELP {PREFIX}_{metric} {help_text}", f"# TYPE {PREFIX}_{metric} gauge"]
+        for category, (gauges, values, statuses) in totals.items():
+            lines.append(prom_line(metric, {"category": category}, gauges.get(name)))
+
+    metric = "tasks"
+    lines += [f"# HELP {PREFIX}_{metric} Tasks by final status.", f"# TYPE {PREFIX}_{metric} gauge"]
+    for category, (gauges, values, statuses) in totals.items():
+        for status, n in sorted(statuses.items(), key=lambda item: str(item[0])):
+            lines.append(prom_line(metric, {"category": category, "status": status}, n))
+    return "\n".join(lines) + "\n"
+
+
+def metrics_json(tasks):
+    result = []
+    for task_id, category, run_date, status, gauges, values in tasks:
+        grouped = {}
+        for (kind, name), value in sorted(values.items()):
+            #http statusai atskirai, kad neuzdengtu task'o status
+            grouped.setdefault("http_status" if kind == "status" else kind, {})[name] = value
+        result.append({"task_id": task_id, "category": category, "run_date": str(run_date), "status": status, **gauges, **grouped})
+    return json.dumps(result, indent=2, default=str)
+
+
+#fmt None - pagal failo pletini (.json arba prometheus textfile)
+#rasom per laikina faila, kad node_exporter niekada nenuskaitytu puses failo
+def write_metrics(path, fmt=None, task_ids=None, since=None, db_path=DB):
+    fmt = fmt or ("json" if str(path).endswith(".json") else "prom")
+    if fmt not in METRICS_FORMATS:
+        raise ValueError(f"unknown metrics format {fmt}, choose from {METRICS_FORMATS}")
+    tasks = load_metrics(task_ids, since, db_path)
+    text = metrics_json(tasks) if fmt == "json" else prometheus_text(tasks)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return len(tasks)
@@ -1,9 +1,14 @@
 import asyncio
-import random
-from .extractor import Extractor
-from .html_parse import Html_ext
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .extractor import Extractor, HttpCache, MAX_CONCURRENCY, MAX_RATE
+from .html_parse import DEFAULT_BACKEND, ParseDiagnostics, parse_cards, parse_listing_diag
+from .metrics import TaskMetrics, write_metrics
 from logger import logger
-from .DB_manage import DBManager
+from .DB_manage import DBManager, MAX_LEASE_ATTEMPTS
+from .archive import HtmlArchive
 
 URL_HEAD = "https://m.aruodas.lt"
 #Skelbimu kategorijos
@@ -14,86 +19,521 @@ CATEGORIES = {
     "SELL_FLAT": "/butai/vilniuje"
     }
 
-CHUNK = 10
+#fetch korutinu skaicius, kiek ju realiai dirba vienu metu sprendzia Extractor limiteris
+#(vienas bendras mandagumo biudzetas visoms kategorijoms)
+FETCH_WORKERS = MAX_CONCURRENCY
+#eiles ribotos, kad discovery nepabegtu per toli nuo fetchinimo
+#ir kad html nesikauptu atmintyje jei parsinimas nespeja
+QUEUE_SIZE = 100
+#parsinimas CPU darbas, tiek procesu kiek branduoliu
+PARSE_WORKERS = os.cpu_count() or 1
+#incrementiniam rezime nepasikeitusius skelbimus vis tiek parsisiunciam kas tiek dienu
+REFRESH_DAYS = 7
+#indekso puslapiai siunciami salyginiai (ETag/Last-Modified), o tikrinti per paskutines
+#tiek minuciu visai nesiunciami. 0 - visada tikrinam su serveriu
+INDEX_TTL_MINUTES = 0
+#incrementiniam rezime: sustojam po tiek is eiles puslapiu be nauju skelbimu, 0 - visada iki 302
+STOP_AFTER_PAGES = 0
+#bet kas tiek dienu pilnas perejimas, kad pamatytume isimtus skelbimus
+FULL_SWEEP_DAYS = 7
 
-#PAGALBINE funkcija procesuoti linkus gabalais
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        #sugrazina iteruojama atkarpom lista
-        yield lst[i:i + n]
+#darbu eileje: kiek indekso puslapiu vienas darbininkas siuncia ir parsina vienu metu
+#(kiekvieno skelbimai keliauja per tas pacias fetch/parse/db eiles)
+#puslapis kuris tik laukia savo skelbimu vietos neuzima
+LEASE_SLOTS = 4
+#nuoma pratesiama kas LEASE_POLL_SECONDS, tai po tiek sekundziu be pratesimo
+#(darbininkas nuluzo ar uzstrigo) darbas atiduodamas kitam
+LEASE_SECONDS = 60
+#kas tiek sekundziu tikrinam eile kai nera ka veikti
+LEASE_POLL_SECONDS = 1.0
 
-async def main():
+#zyme kad kategorijos indekso puslapiai baigti
+DISCOVERY_DONE = object()
 
-    e = Extractor()
-    h = Html_ext()
-    db = DBManager()
 
-    db.ensure_schema()
+#darbu eiles indekso puslapis: laukiam kol visi jo skelbimai pereis db_sink
+class PageItem:
+    def __init__(self, task_id, page):
+        self.task_id = task_id
+        self.page = page
+        self.pending = 0
+        self.done = asyncio.Event()
 
-    #kekvienaam tipui is objektu
-    for key in CATEGORIES:
-        url = f"{URL_HEAD}{CATEGORIES[key]}"
-        page_no = 1
-        all_cat_links = []
+
+#vienos kategorijos busena per visa pipeline
+class CategoryRun:
+    def __init__(self, key, task_id, writer):
+        self.key = key
+        self.task_id = task_id
+        self.writer = writer
+        self.cards = []
+        self.carry_codes = []
+        #pratesiant: frontier skelbimai kurie dar neparsiusti
+        self.todo = []
+        self.diagnostics = ParseDiagnostics()
+        self.metrics = TaskMetrics()
+        #darbu eileje: skelbimo nuoroda -> PageItem'ai kurie jo laukia
+        self.page_items = {}
+        self.pages = 0
+        #kiek skelbimu dar keliauja per eiles
+        self.pending = 0
+        self.discovered = False
+        #indekso klaida: surinkti skelbimai vis tiek irasomi, bet task'as "failed"
+        self.error = None
+        self.finished = False
+        self.started = time.perf_counter()
+
+
+#discovery -> fetch -> parse -> db, kiekvienas etapas atskiros korutinos ir ribotos eiles tarp ju
+class Pipeline:
+    def __init__(self, incremental=False, refresh_days=REFRESH_DAYS, parser=DEFAULT_BACKEND, archive=True,
+                 index_ttl=INDEX_TTL_MINUTES, http_cache=True, url_head=URL_HEAD, db_path="vilnius.db",
+                 stop_after=STOP_AFTER_PAGES, full_sweep_days=FULL_SWEEP_DAYS,
+                 db=None, parse_workers=PARSE_WORKERS, rate_share=1.0, metrics_file=None, max_rate=MAX_RATE):
+        self.incremental = incremental
+        self.refresh_days = refresh_days
+        self.stop_after = stop_after if incremental else 0
+        self.full_sweep_days = full_sweep_days
+        self.parser = parser
+
+        #spawn, nes rnet turi savo threadus ir fork su jais nesaugus
+        self.parse_workers = parse_workers
+        self.pool = ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.index_ttl = index_ttl * 60
+        self.e = Extractor(HttpCache() if http_cache else None, rate_share, max_rate)
+        #kitas url_head/db_path - benchmarkui su lokaliu aruodas pakaitalu
+        self.url_head = url_head
+        #db - shard'e DBClient, kuris visus kvietimus siuncia vienam rasytojo procesui
+        self.db = db or DBManager(db_path)
+        self.db_path = db_path
+        #po run'o metrikos irasomos cia (.json arba prometheus textfile)
+        self.metrics_file = metrics_file
+        self.archive = HtmlArchive(self.db) if archive else None
+        #crawl metu visi db kvietimai per rasytojo threada (AsyncWriter), sukuriamas start_workers
+        self.dbw = None
+
+        self.detail_q = asyncio.Queue(QUEUE_SIZE)
+        self.parse_q = asyncio.Queue(QUEUE_SIZE)
+        self.sink_q = asyncio.Queue(QUEUE_SIZE)
+        #nepavyke skelbimai, bandomi dar karta run'o gale, kad nestabdytu eiles dabar
+        self.dead_letters = []
+        self.runs = []
+        #darbu eileje: task_id -> CategoryRun sitam darbininkui
+        self.task_runs = {}
+        #isnuomoti puslapiai kurie jau idejo kita puslapi i eile ir tik laukia savo skelbimu
+        self.waiting_pages = 0
+        #laikas praleistas rasant i db (sink + kategorijos uzbaigimas)
+        self.db_seconds = 0.0
+
+    #surenka indekso puslapius ir meta skelbimu nuorodas i fetch eile
+    async def discover(self, run):
+        loop = asyncio.get_running_loop()
+        #pratesiant pirma baigiam jau surastus skelbimus
+        for link in run.todo:
+            run.pending += 1
+            await self.detail_q.put((run, link, False))
+        run.todo = []
+        if run.discovered:
+            await self.sink_q.put((run, DISCOVERY_DONE))
+            return
+
+        url = f"{self.url_head}{CATEGORIES[run.key]}"
+        page_no = run.pages + 1
+        stop_after = self.stop_after if not await self.dbw.call(self.full_sweep_due, run.key) else 0
+        #kiek paskutiniu puslapiu is eiles be nauju skelbimu
+        known_pages = 0
         #pirmo  puslapio urlas
-        page_url = f"{url}/"
-        #surenkame pacias nuorodas i house listingus
+        page_url = f"{url}/" if page_no == 1 else f"{url}/puslapis/{page_no}/"
         while True:
-            
             try:
-                html, status = await e.fetch(page_url)
+                result = await self.e.fetch(page_url, cached=True, ttl=self.index_ttl)
+                run.metrics.fetch(result)
                 #gali sustoti jei url blogas ir bus redirectinamas
-                if status == 302:
-                    logger.info(f"last page for cattegory {key} is {page_no}/ or got redirected")
+                if result.status == 302:
+                    logger.info(f"last page for cattegory {run.key} is {page_no}/ or got redirected")
+                    await self.dbw.call(self.db.end_frontier, run.task_id, page_url)
+                    break
+                if result.error is not None:
+                    logger.error(f"index page {page_url} failed after {result.attempts} attempts: {result.error}")
+                    run.error = f"index page {page_no} failed: {result.error}"
                     break
-                links_raw = h.ext_links(html)
-                links = [URL_HEAD + url for url in links_raw]
-                all_cat_links.extend(links)
+                if self.archive and result.status == 200:
+                    await self.dbw.submit(self.sink_write, run, self.archive.add, page_url, run.key, "index", run.task_id, result.body)
+                cards = await loop.run_in_executor(self.pool, parse_cards, result.body, self.parser)
+                cards = [(code, self.url_head + link, card_hash) for code, link, card_hash in cards]
+                run.cards.extend(cards)
+
+                with run.metrics.timed("frontier"):
+                    #incrementiniam rezime siunciam tik naujus ir pasikeitusius
+                    if self.incremental:
+                        fetch_links, carry_codes = await self.dbw.call(self.db.plan_fetch, cards, self.refresh_days)
+                        run.carry_codes.extend(carry_codes)
+                    else:
+                        fetch_links = [link for _, link, _ in cards]
+                    #puslapis laikomas baigtu tik kai jo skelbimai frontier lenteleje
+                    await self.dbw.call(self.db.add_frontier, run.task_id, page_url, cards, fetch_links)
+
+                for link in fetch_links:
+                    run.pending += 1
+                    await self.detail_q.put((run, link, False))
+
+                if stop_after > 0:
+                    with run.metrics.timed("frontier"):
+                        known_pages = known_pages + 1 if await self.dbw.call(self.db.count_new, cards) == 0 else 0
             except Exception as err:
                 logger.info(f"Exception {err}")
+                run.error = f"index page {page_no} failed: {err}"
                 break
 
-            
-
-            #limiting    
-            base_delay = random.uniform(1, 2)
-            await asyncio.sleep(base_delay + random.random() * 0.5)
-
             page_no += 1
             page_url = f"{url}/puslapis/{page_no}/"
-        
-        total_pages = max(0, page_no - 1)
-        db.start_task(category=key, pages=total_pages)
-        db.begin_run()
+            if stop_after > 0 and known_pages >= stop_after:
+                logger.info(f"category {run.key}: {known_pages} pages without new listings, stopping at page {page_no - 1}")
+                await self.dbw.call(self.db.end_frontier, run.task_id, page_url, "stopped")
+                break
+
+        run.pages = max(0, page_no - 1)
+        run.discovered = True
+        await self.sink_q.put((run, DISCOVERY_DONE))
+
+    #ar sitam run'ui reikia eiti iki 302
+    def full_sweep_due(self, key):
+        if self.stop_after == 0:
+            return True
+        last = self.db.last_full_sweep(key)
+        due = last is None or (self.db.run_date - last).days >= self.full_sweep_days
+        if due:
+            logger.info(f"category {key}: full sweep (last one {last})")
+        return due
+
+    async def fetch_worker(self):
+        while True:
+            run, link, requeued = await self.detail_q.get()
+            try:
+                result = await self.e.fetch(link)
+                #pirmo bandymo klaida dar ne galutine, failed skaiciuojam tik po pakartojimo
+                run.metrics.fetch(result, final=requeued)
+                #pirma karta nepavykes lieka pending ir laukia run'o galo
+                if result.error is not None and not requeued:
+                    self.dead_letters.append((run, link))
+                    continue
+                #nebandom istraukineti is html is ne html
+                await self.parse_q.put((run, link, result.body if result.ok else None))
+            except Exception as err:
+                logger.info(f"Exception {err}")
+                await self.parse_q.put((run, link, None))
+            finally:
+                self.detail_q.task_done()
+
+    #kiekvienas parse_worker laukia vieno pool darbo, tai pool'e niekad nebus daugiau nei PARSE_WORKERS html
+    async def parse_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            run, link, html = await self.parse_q.get()
+            row = None
+            parse = None
+            try:
+                if html is not None:
+                    row, seconds, unknown_labels, error = await loop.run_in_executor(
+                        self.pool, parse_listing_diag, html, self.parser
+                    )
+                    parse = (seconds, unknown_labels, error)
+                    run.diagnostics.add(row, *parse)
+                    if error is not None:
+                        logger.info(f"Parse exception {link}: {error}")
+            except Exception as err:
+                logger.info(f"Parse exception {err}")
+            finally:
+                await self.sink_q.put((run, (link, html, row, parse)))
+                self.parse_q.task_done()
+
+    #vienintelis kuris raso i db: eilutes ir kategorijos uzbaigimas keliauja i rasytojo threada,
+    #o sink laukia tik kai rasytojo eile pilna
+    async def db_sink(self):
+        while True:
+            run, item = await self.sink_q.get()
+            try:
+                if item is not DISCOVERY_DONE:
+                    link, html, row, parse = item
+                    run.pending -= 1
+                    await self.dbw.submit(self.sink_write, run, self.store_row, run, link, html, row, parse)
+                    self.item_done(run, link)
+                if run.discovered and run.pending == 0 and not run.finished:
+                    run.finished = True
+                    await self.dbw.submit(self.sink_write, run, self.finish_category, run, run.error)
+            finally:
+                self.sink_q.task_done()
+
+    #rasytojo threade, klaida sustabdo tik sita kategorija
+    def sink_write(self, run, fn, *args):
+        started = time.perf_counter()
         try:
-            #breakina jei praeina sarasas be linku
-            if len(all_cat_links) > 0:
-                links_chunked = chunks(all_cat_links, CHUNK)
-                    
-                for chunk in links_chunked:
-                    # asynchronous laukiam keliu puslapiu duomenu
-                    data = await e.fetch_all(chunk, 6)
-
-                    #nebandom istraukineti is html is ne html
-                    for html, status in data:
-                        if status == 200:
-                            row = h.ext_data(html)
-                            db.insert_row(row,key)
-                db.finalize()
-            
-            db.finish_task()
-        
+            fn(*args)
         except Exception as err:
             # log both to console and tasks table
-            logger.error(f"Error in category {key}: {err}")
-            db.finish_task(records=0, error=str(err))
-    
-    db.close()
+            logger.error(f"Error in category {run.key}: {err}")
+            run.finished = True
+            self.db.finish_task(records=0, error=str(err), task_id=run.task_id, pages=run.pages)
+        finally:
+            seconds = time.perf_counter() - started
+            self.db_seconds += seconds
+            run.metrics.db("sink", seconds)
+
+    #parse_stats keliauja su eilutemis per BatchWriter, run.diagnostics - tik sito proceso suvestinei
+    def store_row(self, run, link, html, row, parse):
+        if self.archive and html is not None:
+            self.archive.add(link, run.key, "listing", run.task_id, html)
+        run.writer.parsed(row, parse)
+        if row is not None:
+            run.writer.add(row, link)
+        else:
+            run.writer.mark(link, "failed")
+
+    def item_done(self, run, link):
+        items = run.page_items.get(link)
+        if not items:
+            return
+        item = items.pop(0)
+        if not items:
+            del run.page_items[link]
+        item.pending -= 1
+        if item.pending == 0:
+            item.done.set()
+
+    #error - task'as baigtas, bet ne viskas pavyko (pvz. darbu eiles puslapiai)
+    def finish_category(self, run, error=None):
+        run.finished = True
+        metrics = run.metrics
+        if self.archive:
+            with metrics.timed("archive"):
+                self.archive.flush()
+        #likucius is buferio imetam pries perkeliant i listings
+        run.writer.flush()
+        metrics.db("flush", run.writer.flush_seconds, run.writer.flushes)
+        with metrics.timed("finalize"):
+            cast_failures = self.db.finalize(run.task_id)
+        for field, (count, example) in cast_failures.items():
+            logger.warning(f"{run.key}: {count} {field} values not understood, e.g. {example!r}")
+        with metrics.timed("carry_forward"):
+            carry_codes = run.carry_codes + self.db.unvisited_codes(run.task_id, run.key)
+            carried = self.db.carry_forward(carry_codes, run.task_id)
+        #pries market_stats, kad artimi dublikatai nebutu skaiciuojami kelis kartus
+        with metrics.timed("clusters"):
+            self.db.update_clusters(run.task_id)
+        with metrics.timed("apply_changes"):
+            self.db.apply_changes(run.task_id)
+        with metrics.timed("market_stats"):
+            self.db.update_market_stats(run.task_id)
+        with metrics.timed("url_index"):
+            self.db.update_url_index(run.cards, run.task_id)
+        self.db.save_task_metrics(metrics.rows(), run.task_id)
+
+        #pratesto task'o eilutes is ankstesnio bandymo irgi skaitosi
+        records = self.db.stg_records(run.task_id) + carried
+        self.db.finish_task(records=records, error=error, task_id=run.task_id, pages=run.pages)
+        elapsed = time.perf_counter() - run.started
+        logger.info(f"category {run.key} done in {elapsed:.1f}s: {run.pages} pages, {records} records")
+        logger.info(f"parse {run.key}: {run.diagnostics.summary()}")
+        logger.info(f"metrics {run.key}: {metrics.summary()}")
+        logger.info(f"rate limiter: {self.e.limiter_stats()}")
+
+    async def drain(self):
+        await self.detail_q.join()
+        await self.parse_q.join()
+        await self.sink_q.join()
+        await self.dbw.join()
+
+    #paskutinis bandymas nepavykusiems, kas nepavyks vel - praleidziama
+    async def requeue_dead_letters(self):
+        dead_letters, self.dead_letters = self.dead_letters, []
+        if len(dead_letters) == 0:
+            return
+        logger.info(f"retrying {len(dead_letters)} failed listings")
+        for run, link in dead_letters:
+            await self.detail_q.put((run, link, True))
+        await self.drain()
+
+    #naujo task'o busena, pratesiant - is frontier lenteles
+    def load_run(self, task_id, key, resume=False):
+        run = CategoryRun(key, task_id, self.db.writer(key, task_id=task_id))
+        if resume:
+            run.cards, run.carry_codes, run.todo, run.pages, run.discovered = self.db.load_frontier(task_id)
+            logger.info(f"resuming {key} (task {task_id}): {run.pages} pages, {len(run.todo)} listings left")
+        return run
+
+    #nutraukto run'o taskai su ju frontier busena, listings_stg nevalom
+    def resume_runs(self):
+        runs = []
+        for task_id, key, run_date in self.db.unfinished_tasks():
+            self.db.run_date = run_date
+            runs.append(self.load_run(task_id, key, resume=True))
+        return runs
+
+    def start_workers(self):
+        self.dbw = self.db.async_writer()
+        workers = [asyncio.create_task(self.fetch_worker()) for _ in range(FETCH_WORKERS)]
+        workers += [asyncio.create_task(self.parse_worker()) for _ in range(self.parse_workers)]
+        workers.append(asyncio.create_task(self.db_sink()))
+        return workers
+
+    def stop_workers(self, workers):
+        for worker in workers:
+            worker.cancel()
+        self.dbw.close()
+        logger.info(f"db writer: {self.dbw.stats()}")
+        if self.archive:
+            self.archive.flush()
+        self.pool.shutdown()
+        if self.e.cache is not None:
+            logger.info(f"http cache: {self.e.cache.stats()}")
+
+    #discovery -> fetch -> parse -> db duotoms kategorijoms
+    async def crawl(self, runs):
+        self.runs = runs
+        workers = self.start_workers()
+
+        await asyncio.gather(*[self.discover(run) for run in runs])
+        #laukiam kol visos eiles istustes
+        await self.drain()
+        await self.requeue_dead_letters()
+        self.stop_workers(workers)
+
+    #darbu eiles darbininkas: nuomojasi indekso puslapius (ir task'u uzbaigimus) kol eile tuscia
+    #worker - unikalus vardas, pagal ji atpazistamos nuomos
+    async def work(self, worker, lease_seconds=LEASE_SECONDS, slots=LEASE_SLOTS, max_attempts=MAX_LEASE_ATTEMPTS):
+        workers = self.start_workers()
+        active = set()
+        while True:
+            leased = []
+            if len(active) - self.waiting_pages < slots:
+                #po viena: kiti darbininkai tarp musu kvietimu gauna savo dali (greicio biudzetas irgi dalinamas)
+                leased = await self.dbw.call(self.db.lease_work, worker, lease_seconds, 1, max_attempts)
+            for task_id, page, kind, key, url in leased:
+                active.add(asyncio.create_task(self.work_item(worker, task_id, page, kind, key, url, max_attempts)))
+            if len(leased) > 0:
+                continue
+            if len(active) > 0:
+                await self.dbw.call(self.db.renew_leases, worker, lease_seconds)
+                _, active = await asyncio.wait(active, timeout=LEASE_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                #kiti darbininkai dar dirba: jei kuris nuluzs, jo darbai grys i eile
+                if len(await self.dbw.call(self.db.open_work_tasks)) == 0:
+                    break
+                await asyncio.sleep(LEASE_POLL_SECONDS)
+
+        await self.drain()
+        self.stop_workers(workers)
+
+    def task_run(self, task_id, key):
+        if task_id not in self.task_runs:
+            self.task_runs[task_id] = CategoryRun(key, task_id, self.db.writer(key, task_id=task_id))
+        return self.task_runs[task_id]
+
+    async def work_item(self, worker, task_id, page, kind, key, url, max_attempts):
+        try:
+            if kind == "finish":
+                await self.dbw.call(self.finish_work, worker, self.task_run(task_id, key))
+                del self.task_runs[task_id]
+            else:
+                await self.work_page(worker, task_id, page, key, url, max_attempts)
+        except Exception as err:
+            logger.error(f"work item {key} task {task_id} page {page} failed: {err}")
+            await self.dbw.call(self.db.release_work, task_id, page, worker, str(err), max_attempts)
+
+    #vienas indekso puslapis: kaip discover, bet kitas puslapis eina i eile o ne i cikla
+    #puslapis baigtas (done) tik kai jo skelbimai irasyti, kitas puslapis eileje jau anksciau
+    async def work_page(self, worker, task_id, page, key, url, max_attempts):
+        loop = asyncio.get_running_loop()
+        run = self.task_run(task_id, key)
+        result = await self.e.fetch(url, cached=True, ttl=self.index_ttl)
+        run.metrics.fetch(result)
+        if result.status == 302:
+            logger.info(f"last page for {key} task {task_id} is {page - 1}")
+            await self.dbw.call(self.db.end_frontier, task_id, url)
+            await self.dbw.call(self.db.complete_work, task_id, page, worker, "last")
+            return
+        if result.error is not None:
+            logger.error(f"index page {url} failed after {result.attempts} attempts: {result.error}")
+            await self.dbw.call(self.db.release_work, task_id, page, worker, result.error, max_attempts)
+            return
+        if self.archive and result.status == 200:
+            await self.dbw.submit(self.sink_write, run, self.archive.add, url, key, "index", task_id, result.body)
+        cards = await loop.run_in_executor(self.pool, parse_cards, result.body, self.parser)
+        cards = [(code, self.url_head + link, card_hash) for code, link, card_hash in cards]
+
+        with run.metrics.timed("frontier"):
+            #perkeliami (carry) lieka frontier lenteleje, uzbaigimas juos ima is ten
+            if self.incremental:
+                fetch_links, _ = await self.dbw.call(self.db.plan_fetch, cards, self.refresh_days)
+            else:
+                fetch_links = [link for _, link, _ in cards]
+            await self.dbw.call(self.db.add_frontier, task_id, url, cards, fetch_links)
+        #kitas puslapis i eile iskart, kad indekso paieska nelauktu sito skelbimu
+        base = url.split("/puslapis/")[0].rstrip("/")
+        await self.dbw.call(self.db.queue_next_page, task_id, page, worker, f"{base}/puslapis/{page + 1}/")
+
+        item = PageItem(task_id, page)
+        for link in fetch_links:
+            item.pending += 1
+            run.page_items.setdefault(link, []).append(item)
+            #dead letter eiles nera, nes run'o galo laukti negalim - nepavyke skelbimai iskart "failed"
+            await self.detail_q.put((run, link, True))
+        if item.pending > 0:
+            self.waiting_pages += 1
+            try:
+                await item.done.wait()
+            finally:
+                self.waiting_pages -= 1
+
+        #eilutes i db pries pazymint puslapi baigtu, kitaip nuluzus darbininkui dingtu
+        #(rasytojo eile vykdoma is eiles, tai flush eina po visu sito puslapio eiluciu)
+        await self.dbw.call(run.writer.flush)
+        #metrikos saugomos po kiekvieno puslapio (sumuojamos), nes task'a baigia nebutinai sitas darbininkas
+        #(parse_stats jau irasyti su eilutemis flush metu)
+        metrics, run.metrics = run.metrics, TaskMetrics()
+        await self.dbw.call(self.db.save_task_metrics, metrics.rows(), task_id)
+        await self.dbw.call(self.db.complete_work, task_id, page, worker, "done")
+
+    #rasytojo threade: task'o uzbaigimas is frontier busenos, visi puslapiai jau baigti (gal ir kitu darbininku)
+    #nuluzus viduryje darbas grizta i eile, zingsniai kartojami saugiai (upsert)
+    def finish_work(self, worker, run):
+        run.cards, run.carry_codes, _, run.pages, _ = self.db.load_frontier(run.task_id)
+        failed = self.db.failed_pages(run.task_id)
+        self.finish_category(run, f"index pages {failed} failed" if failed else None)
+        self.db.complete_work(run.task_id, 0, worker)
+
+    async def run(self, resume=False):
+        started = time.perf_counter()
+        self.db.ensure_schema()
+
+        if resume:
+            runs = self.resume_runs()
+        else:
+            runs = [self.load_run(task_id, key) for task_id, key, _ in self.db.start_run(CATEGORIES)]
+        if len(runs) == 0:
+            logger.info("nothing to resume")
+
+        await self.crawl(runs)
+        self.db.close()
+        if self.metrics_file:
+            write_metrics(self.metrics_file, task_ids=[run.task_id for run in runs], db_path=self.db_path)
+            logger.info(f"metrics written to {self.metrics_file}")
+        logger.info(f"pipeline done in {time.perf_counter() - started:.1f}s")
+
+
+async def main(incremental=False, refresh_days=REFRESH_DAYS, parser=DEFAULT_BACKEND, archive=True, resume=False,
+               index_ttl=INDEX_TTL_MINUTES, http_cache=True, stop_after=STOP_AFTER_PAGES, full_sweep_days=FULL_SWEEP_DAYS,
+               metrics_file=None):
+    await Pipeline(incremental, refresh_days, parser, archive, index_ttl, http_cache,
+                   stop_after=stop_after, full_sweep_days=full_sweep_days, metrics_file=metrics_file).run(resume)
 
 #kad cli veikia reikia synchronous funkcijos
-def run_pipeline():
-    asyncio.run(main())
+def run_pipeline(incremental=False, refresh_days=REFRESH_DAYS, parser=DEFAULT_BACKEND, archive=True, resume=False,
+                 index_ttl=INDEX_TTL_MINUTES, http_cache=True, stop_after=STOP_AFTER_PAGES, full_sweep_days=FULL_SWEEP_DAYS,
+                 metrics_file=None):
+    asyncio.run(main(incremental, refresh_days, parser, archive, resume, index_ttl, http_cache, stop_after, full_sweep_days,
+                     metrics_file))
 
 
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    run_pipeline()
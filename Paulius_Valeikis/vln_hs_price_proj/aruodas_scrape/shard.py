@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from logger import logger
+from .DB_manage import DBManager, AsyncWriter, BatchWriter, FLUSH_ROWS, WRITE_QUEUE_SIZE, WRITE_BATCH
+from .metrics import write_metrics
+from .pipeline_db import CATEGORIES, PARSE_WORKERS, Pipeline
+
+#duckdb leidzia tik viena rasytoja: pagrindinis procesas laiko vilnius.db ir vykdo
+#DBManager kvietimus, o shard'ai (atskiri procesai su savo event loop) crawl'ina savo kategorijas
+#ir siuncia kvietimus per eile. Eilutes shard'e kaupia BatchWriter, tai i eile keliauja paketai
+DEFAULT_SHARDS = 2
+#kas tiek sekundziu patikrinam ar shard'ai dar gyvi
+POLL_SECONDS = 1.0
+
+
+#shard'o puseje vietoj DBManager: tie patys metodai, bet vykdomi rasytojo procese
+class DBClient:
+    def __init__(self, shard_no, requests, replies):
+        self.shard_no = shard_no
+        self.requests = requests
+        self.replies = replies
+        self._run_date = None
+
+    def call(self, method, *args, **kwargs):
+        self.requests.put((self.shard_no, method, args, kwargs))
+        ok, value = self.replies.get()
+        if not ok:
+            raise RuntimeError(f"writer: {value}")
+        return value
+
+    #bet kuris DBManager metodas
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    #BatchWriter ja skaito kiekvienai eilutei, tai laikom ir cia
+    @property
+    def run_date(self):
+        if self._run_date is None:
+            self._run_date = self.call("getattr", "run_date")
+        return self._run_date
+
+    @run_date.setter
+    def run_date(self, value):
+        self.call("setattr", "run_date", value)
+        self._run_date = value
+
+    #buferis lieka shard'e, rasytojui siunciami tik flush paketai
+    def writer(self, category, flush_rows=FLUSH_ROWS, task_id=None):
+        return BatchWriter(self, category, flush_rows, task_id)
+
+    #kvietimai i rasytojo procesa blokuoja, tai ir shard'e jie daromi ne event loop threade
+    def async_writer(self, queue_size=WRITE_QUEUE_SIZE, batch=WRITE_BATCH):
+        return AsyncWriter(self, queue_size, batch)
+
+    #rasytojui: sitas shard'as baige
+    def close(self):
+        self.call("close")
+
+
+#shard'o procesas: tasks - [(task_id, category, run_date)]
+def crawl_shard(shard_no, tasks, resume, requests, replies, options):
+    db = DBClient(shard_no, requests, replies)
+    pipeline = Pipeline(db=db, **options)
+    runs = []
+    for task_id, key, run_date in tasks:
+        db.run_date = run_date
+        runs.append(pipeline.load_run(task_id, key, resume))
+    logger.info(f"shard {shard_no}: {', '.join(run.key for run in runs)}")
+    asyncio.run(pipeline.crawl(runs))
+    db.close()
+
+
+#rasytojo ciklas: vykdo shard'u kvietimus kol visi baigia (arba nebera gyvu)
+def serve(db, requests, replies, processes):
+    running = len(processes)
+    calls = 0
+    while running > 0:
+        try:
+            shard_no, method, args, kwargs = requests.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                break
+            continue
+
+        calls += 1
+        try:
+            if method == "close":
+                running -= 1
+                value = None
+            elif method == "getattr":
+                value = getattr(db, *args)
+            elif method == "setattr":
+                value = setattr(db, *args)
+            else:
+                value = getattr(db, method)(*args, **kwargs)
+            replies[shard_no].put((True, value))
+        except Exception as err:
+            logger.error(f"writer: {method} from shard {shard_no} failed: {err}")
+            replies[shard_no].put((False, f"{type(err).__name__}: {err}"))
+    return calls
+
+
+#kategorijos paskirstomos shard'ams, taskai sukuriami cia, tai task_id ir busenos bendros visiems
+#nuluzes shard'as palieka savo taskus 'running' - juos galima pratesti su resume
+def run_sharded(shards=DEFAULT_SHARDS, resume=False, db_path="vilnius.db", **options):
+    started = time.perf_counter()
+    db = DBManager(db_path)
+    db.ensure_schema()
+    if resume:
+        tasks = db.unfinished_tasks()
+    else:
+        tasks = db.start_run(CATEGORIES)
+    if len(tasks) == 0:
+        logger.info("nothing to resume")
+        db.close()
+        return
+
+    shards = max(1, min(shards, len(tasks)))
+    #hostas tas pats, tai mandagumo biudzetas ir parse procesai dalinami
+    options["rate_share"] = 1.0 / shards
+    options["parse_workers"] = max(1, PARSE_WORKERS // shards)
+
+    ctx = multiprocessing.get_context("spawn")
+    requests = ctx.Queue()
+    replies = [ctx.Queue() for _ in range(shards)]
+    processes = [
+        ctx.Process(target=crawl_shard, args=(n, tasks[n::shards], resume, requests, replies[n], options))
+        for n in range(shards)
+    ]
+    for p in processes:
+        p.start()
+
+    calls = serve(db, requests, replies, processes)
+    for p in processes:
+        p.join()
+        if p.exitcode != 0:
+            logger.error(f"shard {processes.index(p)} exited with {p.exitcode}, its tasks can be continued with --resume")
+    db.close()
+    if options.get("metrics_file"):
+        write_metrics(options["metrics_file"], task_ids=[task_id for task_id, _, _ in tasks], db_path=db_path)
+    logger.info(f"{shards} shards done in {time.perf_counter() - started:.1f}s, {calls} writer calls")
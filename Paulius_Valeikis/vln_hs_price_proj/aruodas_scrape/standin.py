@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import zlib
+from pathlib import Path
+from bs4 import BeautifulSoup
+from .html_parse import CARD_LINK_CLASS
+from .pipeline_db import CATEGORIES
+
+#lokalus aruodas pakaitalas benchmarkams: /<kategorija>/<miestas>/ ir /<kategorija>/<miestas>/puslapis/N/,
+#uz paskutinio puslapio 302 atgal i pirma, skelbimai /<slug>-<kodas>/
+STANDIN_PORT = 8766
+STANDIN_PAGES = 5
+STANDIN_PER_PAGE = 20
+#vietoj skelbimo kodo issaugotuose puslapiuose
+CODE_SLOT = "__CODE__"
+NUORODA_RE = re.compile(r"m\.aruodas\.lt/\d+-\d+")
+
+
+#sugeneruoti puslapiai, jei nera issaugotu
+def synthetic_index(codes):
+    cards = [
+        f'<div class="list-row"><a class="{CARD_LINK_CLASS}" href="/skelbimas-{code}/"><img/></a>'
+        f'<span class="list-item-price">{1000 + i} €</span></div>'
+        for i, code in enumerate(codes)
+    ]
+    return "<html><body>" + "".join(cards) + "</body></html>"
+
+
+def synthetic_listing(code):
+    h = int(hashlib.md5(code.encode("utf-8")).hexdigest()[:6], 16)
+    return f"""<html><body><div class="advert-heading-col title-col"><h1>Vilnius, Antakalnis, Sapiegos g.</h1></div>
+<span class="main-price">{100000 + h % 50000} €</span>
+<dl><dt>Plotas</dt><dd>{30 + h % 90},5 m²</dd><dt>Kambarių sk.</dt><dd>{1 + h % 4}</dd><dt>Aukštas</dt><dd>{1 + h % 9}</dd>
+<dt>Aukštų sk.</dt><dd>9</dd><dt>Metai</dt><dd>1975 m. statyba, 2018 m. renovacija</dd>
+<dt>Ypatybės</dt><dd><span>Nauja kanalizacija</span><span>Varžytynės</span></dd>
+<dt>Nuoroda</dt><dd>m.aruodas.lt/{code}</dd><dt>Įvestas</dt><dd>2025-10-01</dd><dt>Redaguotas</dt><dd>2025-11-01</dd>
+<dt>Peržiūrėjo</dt><dd>{h % 5000}/12</dd></dl></body></html>"""
+
+
+#issaugotas indekso puslapis paverciamas sablonu: kiekvienos korteles nuoroda -> CODE_SLOT
+def index_template(html):
+    soup = BeautifulSoup(html, "html.parser")
+    links = soup.find_all("a", class_=CARD_LINK_CLASS)
+    for a in links:
+        a["href"] = f"/skelbimas-{CODE_SLOT}/"
+    return str(soup), len(links)
+
+
+class StandinSite:
+    #fixtures - folderis su issaugotais .html (kaip bench parser), be jo puslapiai generuojami
+    def __init__(self, pages=STANDIN_PAGES, per_page=STANDIN_PER_PAGE, fixtures=None, latency=0.0, error_rate=0.0, seed=0):
+        self.pages = pages
+        self.per_page = per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.index_templates = []
+        self.listing_fixtures = []
+        if fixtures:
+            self.load_fixtures(fixtures)
+        #kiek ko atiduota, benchmarkui
+        self.requests = 0
+        self.statuses = {}
+
+    def load_fixtures(self, folder):
+        for path in sorted(Path(folder).rglob("*.html")):
+            html = path.read_text(encoding="utf-8")
+            if "main-price" in html:
+                self.listing_fixtures.append(html)
+            else:
+                template, cards = index_template(html)
+                if cards > 0:
+                    self.index_templates.append((template, cards))
+
+    #kiekvienas miestas turi savo kodus, vilniaus kodai tokie patys kaip ir anksciau
+    def codes(self, category_no, page_no, city="vilniuje"):
+        per_page = self.index_templates[0][1] if self.index_templates else self.per_page
+        city_no = 0 if city == "vilniuje" else zlib.crc32(city.encode("utf-8")) % 900 + 1
+        return [f"{category_no + 1}-{city_no * 1000000 + page_no * 1000 + i}" for i in range(per_page)]
+
+    def index(self, category_no, page_no, city="vilniuje"):
+        codes = self.codes(category_no, page_no, city)
+        if not self.index_templates:
+            return synthetic_index(codes)
+        template, _ = self.index_templates[page_no % len(self.index_templates)]
+        for code in codes:
+            template = template.replace(CODE_SLOT, code, 1)
+        return template
+
+    def listing(self, code):
+        if not self.listing_fixtures:
+            return synthetic_listing(code)
+        html = self.listing_fixtures[int(code.split("-")[1]) % len(self.listing_fixtures)]
+        #kiekvienas skelbimas turi savo koda, kitaip visi gautu ta pati listing_id
+        return NUORODA_RE.sub(f"m.aruodas.lt/{code}", html)
+
+    #(status, headers, body)
+    def route(self, path, headers):
+        for category_no, category in enumerate(CATEGORIES.values()):
+            prefix = category.rsplit("/", 1)[0]
+            match = re.fullmatch(re.escape(prefix) + r"/([a-z]+)/(?:puslapis/(\d+)/)?", path)
+            if match:
+                city = match.group(1)
+                page_no = int(match.group(2) or 1)
+                if page_no > self.pages:
+                    return 302, {"Location": f"{prefix}/{city}/"}, ""
+                body = self.index(category_no, page_no, city)
+                etag = '"' + hashlib.md5(body.encode("utf-8")).hexdigest() + '"'
+                if headers.get("if-none-match") == etag:
+                    return 304, {"ETag": etag}, ""
+                return 200, {"ETag": etag}, body
+        match = re.fullmatch(r"/[^/]*?(\d+-\d+)/", path)
+        if match:
+            return 200, {}, self.listing(match.group(1))
+        return 404, {}, ""
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                path = request_line.decode("latin-1").split(" ")[1]
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.random.random() < self.error_rate:
+                    status, extra, body = 503, {}, ""
+                else:
+                    status, extra, body = self.route(path, headers)
+                self.requests += 1
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+
+                data = body.encode("utf-8")
+                head = [f"HTTP/1.1 {status} X", "Content-Type: text/html; charset=utf-8", f"Content-Length: {len(data)}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=STANDIN_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    #atskiras threadas su savo event loop, kad pipeline galetu naudoti asyncio.run
+    def start(self, host="127.0.0.1", port=STANDIN_PORT):
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(asyncio.start_server(self.handle, host, port))
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return f"http://{host}:{port}"
+
+
+#rankiniam testavimui: python -m aruodas_scrape.standin --pages 3
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=STANDIN_PORT)
+    parser.add_argument("--pages", type=int, default=STANDIN_PAGES)
+    parser.add_argument("--per-page", type=int, default=STANDIN_PER_PAGE)
+    parser.add_argument("--fixtures", help="folder with saved index and listing .html pages")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    args = parser.parse_args()
+
+    site = StandinSite(args.pages, args.per_page, args.fixtures, args.latency, args.error_rate)
+    print(f"serving on http://127.0.0.1:{args.port}")
+    asyncio.run(site.serve(port=args.port))
+
+
+if __name__ == "__main__":
+    main()
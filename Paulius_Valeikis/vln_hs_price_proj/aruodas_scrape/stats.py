@@ -0,0 +1,95 @@
+import duckdb
+from .DB_manage import DBManager, SKETCH_GAMMA
+
+DB = "vilnius.db"
+
+#atsakymai tik is market_daily ir market_sketch, listings neskenuojama
+STATS_GROUPS = {
+    "hood": "hood",
+    "category": "category",
+    "city": "city",
+    "day": "CAST(ext_date AS TEXT)",
+}
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+#bucket'o reiksmes ivertis, paklaida ne didesne uz SKETCH_ACCURACY
+def bucket_value_sql(bucket):
+    return f"2 * pow({SKETCH_GAMMA}, {bucket}) / ({SKETCH_GAMMA} + 1)"
+
+
+#be datu - paskutine turima diena (grupuojant pagal diena - visos dienos)
+#visada atskirai kiekvienai kategorijai ir miestui: nuomos ir pardavimo kainos (ar Vilniaus ir Kauno) viename kvantilyje neturi prasmes
+def market_stats(by="hood", metric="price_sqm", category=None, city=None, hood=None, since=None, until=None, db_path=DB):
+    group = STATS_GROUPS[by]
+    keys = [key for key in ["category", "city"] if key != by]
+    partition = ", ".join(keys + ["grp"])
+    with duckdb.connect(db_path, read_only=True) as con:
+        if since is None and until is None and by != "day":
+            since = until = con.execute("SELECT max(ext_date) FROM market_daily;").fetchone()[0]
+
+        where = """metric = ?
+            AND ext_date >= coalesce(CAST(? AS DATE), ext_date)
+            AND ext_date <= coalesce(CAST(? AS DATE), ext_date)
+            AND category = coalesce(?, category)
+            AND city = coalesce(?, city)
+            AND hood = coalesce(?, hood)"""
+        params = [metric, since, until, category, city, hood]
+
+        cuts = ", ".join(f"min(bucket) FILTER (WHERE cum >= {q} * total) AS q{i}" for i, q in enumerate(QUANTILES))
+        #ivertis negali iseiti uz tikru min/max ribu
+        values = ", ".join(
+            f"round(least(greatest({bucket_value_sql(f'q.q{i}')}, d.min_value), d.max_value), 1) AS p{round(q * 100)}"
+            for i, q in enumerate(QUANTILES)
+        )
+        query = f"""
+            WITH buckets AS (
+                SELECT category, city, {group} AS grp, bucket, sum(n) AS n
+                FROM market_sketch
+                WHERE {where}
+                GROUP BY ALL
+            ),
+            cumulative AS (
+                SELECT category, city, grp, bucket,
+                    sum(n) OVER (PARTITION BY {partition} ORDER BY bucket) AS cum,
+                    sum(n) OVER (PARTITION BY {partition}) AS total
+                FROM buckets
+            ),
+            q AS (
+                SELECT {partition}, {cuts}
+                FROM cumulative
+                GROUP BY ALL
+            ),
+            d AS (
+                SELECT category, city, {group} AS grp, sum(n) AS n, sum(total) / sum(n) AS mean,
+                    min(min_value) AS min_value, max(max_value) AS max_value
+                FROM market_daily
+                WHERE {where}
+                GROUP BY ALL
+            )
+            SELECT {"".join(f"d.{key}, " for key in keys)}d.grp AS {by}, d.n, round(d.mean, 1) AS mean, {values},
+                round(d.min_value, 1) AS min, round(d.max_value, 1) AS max
+            FROM d
+            JOIN q USING ({partition})
+            ORDER BY d.category, d.city, d.n DESC, d.grp;
+        """
+        result = con.execute(query, params + params)
+        columns = [c[0] for c in result.description]
+        return columns, result.fetchall()
+
+
+#paprasta lentele terminalui
+def format_table(columns, rows):
+    cells = [columns] + [["" if v is None else str(v) for v in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    lines = ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
+
+
+#agregatai is visu dienu, suspaustos skaitomos is listing_snapshots (senoms db arba po naujos metrikos)
+def rebuild_stats(db_path=DB):
+    db = DBManager(db_path)
+    db.ensure_schema()
+    db.rebuild_market_stats()
+    db.close()
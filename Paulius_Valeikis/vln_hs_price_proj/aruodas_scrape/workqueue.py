@@ -0,0 +1,103 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+from logger import logger
+from .DB_manage import DBManager, MAX_LEASE_ATTEMPTS
+from .metrics import write_metrics
+from .pipeline_db import PARSE_WORKERS, LEASE_SECONDS, Pipeline
+from .shard import DBClient, serve
+
+#crawl taikiniai (miestai x kategorijos) is konfiguracijos, isskleidziami i work_queue lentele.
+#darbininkai (atskiri procesai) nuomojasi po indekso puslapi su laiko limitu, kitas puslapis
+#patenka i eile tik apdorojus ankstesni (puslapiu skaicius zinomas tik gavus 302).
+#i vilnius.db raso tik pagrindinis procesas, kaip ir shard.py
+CONFIG = "aruodas_scrape/crawl_targets.json"
+DEFAULT_WORKERS = 4
+
+
+#{"url_head", "categories": {KEY: "/kelias/{city}"}, "cities": {Miestas: "slug"}, "workers", "lease_seconds", "max_attempts"}
+def load_config(path=CONFIG):
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    for field in ["url_head", "categories", "cities"]:
+        if field not in config:
+            raise ValueError(f"{path}: missing {field}")
+    return config
+
+
+#[(city, category, url)] kiekvienam miestui ir kategorijai
+def expand_targets(config, url_head=None):
+    url_head = url_head or config["url_head"]
+    return [
+        (city, key, url_head + path.format(city=slug))
+        for city, slug in config["cities"].items()
+        for key, path in config["categories"].items()
+    ]
+
+
+#darbininko procesas, vardas unikalus ir tarp run'u (pagal ji atpazistamos nuomos)
+def queue_worker(worker_no, requests, replies, options, lease_seconds, max_attempts):
+    db = DBClient(worker_no, requests, replies)
+    pipeline = Pipeline(db=db, **options)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    logger.info(f"worker {worker_no} ({worker}) started")
+    asyncio.run(pipeline.work(worker, lease_seconds, max_attempts=max_attempts))
+    db.close()
+
+
+#nuluzusio darbininko darbai grizta i eile kai baigiasi nuoma ir juos paima kiti,
+#nuluzus visam run'ui - resume tesia ta pacia eile
+def run_queue(config=CONFIG, workers=None, resume=False, db_path="vilnius.db", **options):
+    #puslapiai eina per skirtingus worker'ius, tusciu puslapiu serijos niekas neskaiciuoja
+    if options.get("incremental") and options.get("stop_after"):
+        raise ValueError("stop_after is not supported in work queue mode, it always pages to the end")
+    started = time.perf_counter()
+    config = load_config(config)
+    workers = workers or config.get("workers", DEFAULT_WORKERS)
+    lease_seconds = config.get("lease_seconds", LEASE_SECONDS)
+    max_attempts = config.get("max_attempts", MAX_LEASE_ATTEMPTS)
+    options.setdefault("url_head", config["url_head"])
+
+    db = DBManager(db_path)
+    db.ensure_schema()
+    if resume:
+        tasks = db.open_work_tasks()
+        if len(tasks) > 0:
+            db.run_date = tasks[0][2]
+    else:
+        tasks = db.enqueue_run(expand_targets(config, options["url_head"]))
+    if len(tasks) == 0:
+        logger.info("nothing to resume")
+        db.close()
+        return
+    logger.info(f"{len(tasks)} targets in the work queue, {workers} workers")
+
+    #hostas tas pats, tai mandagumo biudzetas ir parse procesai dalinami
+    options["rate_share"] = 1.0 / workers
+    options["parse_workers"] = max(1, PARSE_WORKERS // workers)
+
+    ctx = multiprocessing.get_context("spawn")
+    requests = ctx.Queue()
+    replies = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=queue_worker, args=(n, requests, replies[n], options, lease_seconds, max_attempts))
+        for n in range(workers)
+    ]
+    for p in processes:
+        p.start()
+
+    calls = serve(db, requests, replies, processes)
+    for p in processes:
+        p.join()
+        if p.exitcode != 0:
+            logger.error(f"worker {processes.index(p)} exited with {p.exitcode}, its pages go back to the queue when the lease expires")
+    left = db.open_work_tasks()
+    if len(left) > 0:
+        logger.error(f"{len(left)} targets not finished, continue with --resume")
+    db.close()
+    if options.get("metrics_file"):
+        write_metrics(options["metrics_file"], task_ids=[task_id for task_id, _, _ in tasks], db_path=db_path)
+    logger.info(f"{workers} workers done in {time.perf_counter() - started:.1f}s, {calls} writer calls")